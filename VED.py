@@ -74,19 +74,23 @@ if __name__ == "__main__":
 
 -----------------------------------------------------------------------------------------------------------------------------------
 
-import pandas as pd
 import os
-from openpyxl import load_workbook
-from openpyxl.utils.dataframe import dataframe_to_rows
-from tqdm import tqdm
 import shutil
 
+from VED_input_cache import read_excel_cached
+from VED_metrics import FileMetrics, write_run_report, progress, say
+from VED_row_index import RowKeyIndex, row_keys
+from VED_routing import PrefixIndex
+from VED_xlsx import SchemaCache, SCHEMA_CACHE_NAME
+
 # ======================================
 # Настройки путей и параметров
 # ======================================
 input_file = "/content/VED/Input/31 группа 2023-2024.xlsx" # Исходный файл
 target_folder = "/content/VED/Target_files"                # Шаблоны файлов
 output_folder = "/content/VED/Output"                      # Результаты
+input_cache_dir = "/content/VED/.input_cache"              # Кэш разобранного исходного файла (None — отключить)
+append_only_new = True                                     # Дописывать только новые строки (ключ: ND + G32, индекс Output/row_index.sqlite)
 
 # Соответствие кодов ТН ВЭД → файл
 code_mapping = {
@@ -136,50 +140,54 @@ sheet_mapping = {
 }
 
 
-def get_sheet_columns(filename, sheet_name):
-    #Получает заголовки колонок из указанного листа Excel
+def get_sheet_columns(filename, sheet_name, schema_cache):
+    #Получает заголовки колонок из указанного листа Excel (первая строка, с кэшем по mtime файла)
     try:
-        df = pd.read_excel(filename, sheet_name=sheet_name, nrows=0)
-        return df.columns.tolist()
+        return schema_cache.columns(filename, sheet_name)
     except Exception as e:
         print(f"❌ Ошибка чтения заголовков из '{filename}', лист '{sheet_name}': {e}")
         return []
 
 
-def append_df_to_excel(filename, df, sheet_name='Sheet1'):
-    #Добавляет DataFrame в конец указанного листа Excel
+def append_sheets_to_excel(filename, sheet_frames):
+    #Добавляет DataFrame'ы в конец листов Excel: книга открывается и сохраняется один раз на все листы
+    from openpyxl import load_workbook
+    from openpyxl.utils.dataframe import dataframe_to_rows
+
     if os.path.exists(filename):
         book = load_workbook(filename)
-        if sheet_name in book.sheetnames:
-            ws = book[sheet_name]
-        else:
-            ws = book.create_sheet(sheet_name)
     else:
         from openpyxl import Workbook
         book = Workbook()
         book.remove(book.active)
-        ws = book.create_sheet(sheet_name)
 
-    old_max_row = ws.max_row
+    for sheet_name, df in sheet_frames.items():
+        if sheet_name in book.sheetnames:
+            ws = book[sheet_name]
+        else:
+            ws = book.create_sheet(sheet_name)
+
+        old_max_row = ws.max_row
 
-    print(f"\n📄 Файл: {filename}, Лист: {sheet_name}")
-    print(f"📏 Старый размер: {old_max_row} строк")
-    print(f"🆕 Новый размер: {len(df)} строк")
-    print(f"🧮 Общий размер после добавления: {old_max_row + len(df)} строк")
+        say(f"\n📄 Файл: {filename}, Лист: {sheet_name}")
+        say(f"📏 Старый размер: {old_max_row} строк")
+        say(f"🆕 Новый размер: {len(df)} строк")
+        say(f"🧮 Общий размер после добавления: {old_max_row + len(df)} строк")
 
-    startrow = old_max_row + 1
+        # Запись начинается сразу после max_row, как и раньше. ws.append продолжил бы
+        # с внутреннего счётчика строк, который у шаблона с оформлением ниже данных другой
+        startrow = old_max_row + 1
 
-    # Добавляем заголовки, если файл пустой
-    if old_max_row == 0 and not df.empty:
-        for col_idx, col_name in enumerate(df.columns, 1):
-            ws.cell(row=startrow, column=col_idx, value=col_name)
-        startrow += 1
+        # Добавляем заголовки, если лист пустой
+        if old_max_row == 0 and not df.empty:
+            for col_idx, col_name in enumerate(df.columns, 1):
+                ws.cell(row=startrow, column=col_idx, value=col_name)
+            startrow += 1
 
-    # Записываем данные
-    for row in dataframe_to_rows(df, index=False, header=False):
-        for c_idx, value in enumerate(row, 1):
-            ws.cell(row=startrow, column=c_idx, value=value)
-        startrow += 1
+        # Записываем данные после последней заполненной строки (оформление и формулы шаблона не затрагиваются)
+        for row_idx, row in enumerate(dataframe_to_rows(df, index=False, header=False), startrow):
+            for col_idx, value in enumerate(row, 1):
+                ws.cell(row=row_idx, column=col_idx, value=value)
 
     book.save(filename)
 
@@ -193,15 +201,33 @@ def process_data():
     os.makedirs(output_folder, exist_ok=True)
     print(f"🔹 Папка для результатов: {output_folder}")
 
+    # Тяжёлые библиотеки импортируются, только когда есть что обрабатывать
+    import pandas as pd
+
+    # Метрики этапов (read, route, write): Output/metrics/<файл>.json, Output/metrics.csv
+    metrics = FileMetrics(os.path.basename(input_file))
+
     # 2. Загрузка исходных данных
-    source_df = pd.read_excel(input_file)
+    with metrics.stage('read'):
+        source_df = read_excel_cached(input_file, cache_dir=input_cache_dir)
+    metrics.add('read', 0, len(source_df))
     print(f"✅ Загружен исходный файл. Записей: {len(source_df)}")
 
     if 'G33 (код товара по ТН ВЭД РФ)' not in source_df.columns:
         print("❌ В файле отсутствует колонка 'G33 (код товара по ТН ВЭД РФ)'")
         return
 
-    # 3. Группировка данных
+    schema_cache = SchemaCache(os.path.join(output_folder, SCHEMA_CACHE_NAME))
+
+    # 3. Группировка данных: каждая строка получает целевой файл за один проход
+    #    (самый длинный совпавший префикс кода из code_mapping)
+    routing = PrefixIndex(code_mapping)
+    with metrics.stage('route', len(source_df)):
+        file_groups = routing.groups(source_df, 'G33 (код товара по ТН ВЭД РФ)')
+    codes_by_file = {}
+    for code, filename in code_mapping.items():
+        codes_by_file.setdefault(filename, []).append(code)
+
     results = {}  # <-- Объявляем результат внутри функции
 
     for filename, sheet_names in sheet_mapping.items():
@@ -215,25 +241,28 @@ def process_data():
         # Читаем заголовки из целевого файла
         sheet_columns = {}
         for sheet in sheet_names:
-            cols = get_sheet_columns(output_path, sheet)
+            cols = get_sheet_columns(output_path, sheet, schema_cache)
             sheet_columns[sheet] = cols
 
-        # Фильтруем данные по code_mapping
-        matched_codes = [k for k, v in code_mapping.items() if v == filename]
-        file_data = source_df[source_df['G33 (код товара по ТН ВЭД РФ)'].astype(str).isin(matched_codes)]
-
-        if not file_data.empty:
+        file_data = file_groups.get(filename)
+        if file_data is not None and not file_data.empty:
             results[output_path] = {'sheet_columns': sheet_columns, 'data': file_data}
 
     # 4. Сохранение данных в нужные файлы и листы
-    for output_path, data_info in results.items():
+    row_index = RowKeyIndex(output_folder) if append_only_new else None
+    written_rows = 0
+
+    for output_path, data_info in progress(results.items(), total=len(results), desc="Файлы"):
         sheet_columns = data_info['sheet_columns']
         full_data = data_info['data']
+        keys = row_keys(full_data) if row_index is not None else None
 
-        matched_codes = [k for k, v in code_mapping.items() if v == os.path.basename(output_path)]
+        matched_codes = codes_by_file.get(os.path.basename(output_path), [])
 
-        print(f"\n📊 Статистика переноса данных для {os.path.basename(output_path)}:")
+        say(f"\n📊 Статистика переноса данных для {os.path.basename(output_path)}:")
         total_rows = 0
+        sheet_frames = {}
+        sheet_keys = {}
 
         for sheet_name, columns in sheet_columns.items():
             # Формируем DataFrame с тем же порядком колонок, как в шаблоне
@@ -245,21 +274,52 @@ def process_data():
                 else:
                     filtered_data[col] = None  # Оставляем пустую колонку
 
-            if not filtered_data.empty:
-                append_df_to_excel(output_path, filtered_data, sheet_name=sheet_name)
-                total_rows += len(filtered_data)
-
-                print(f"📌 Лист '{sheet_name}'")
-                print(f"   • Найдено записей: {len(filtered_data)}")
-                missing_cols = [col for col in columns if col not in source_df.columns]
-                if missing_cols:
-                    print(f"   ⚠️ Отсутствующие колонки в input: {missing_cols}")
+            # Строки, уже перенесённые прошлыми запусками, пропускаем
+            skipped = 0
+            if row_index is not None and not filtered_data.empty:
+                new_mask = row_index.new_rows_mask(output_path, sheet_name, keys)
+                skipped = len(new_mask) - sum(new_mask)
+                filtered_data = filtered_data[new_mask]
+                if skipped:
+                    say(f"⏭️ Лист '{sheet_name}': уже загружено строк: {skipped}")
 
-        print(f"📦 Всего добавлено строк: {total_rows}")
+            if not filtered_data.empty:
+                sheet_frames[sheet_name] = filtered_data
+                if row_index is not None:
+                    sheet_keys[sheet_name] = [k for k, new in zip(keys, new_mask) if new]
+
+        # Все листы книги дописываются за одно открытие и одно сохранение
+        if sheet_frames:
+            rows = sum(len(frame) for frame in sheet_frames.values())
+            with metrics.stage('write', rows):
+                append_sheets_to_excel(output_path, sheet_frames)
+            written_rows += rows
+            # Заголовки не менялись — кэш схемы остаётся верным для новой версии файла
+            schema_cache.touch(output_path)
+            for sheet_name, keys_written in sheet_keys.items():
+                row_index.add(output_path, sheet_name, keys_written)
+
+        for sheet_name, filtered_data in sheet_frames.items():
+            total_rows += len(filtered_data)
+
+            say(f"📌 Лист '{sheet_name}'")
+            say(f"   • Найдено записей: {len(filtered_data)}")
+            missing_cols = [col for col in sheet_columns[sheet_name] if col not in source_df.columns]
+            if missing_cols:
+                say(f"   ⚠️ Отсутствующие колонки в input: {missing_cols}")
+
+        say(f"📦 Всего добавлено строк: {total_rows}")
         matched_codes_str = "', '".join(matched_codes)
-        print(f"🏷️  По кодам ТН ВЭД: '{matched_codes_str}'")
-        print(f"💾 Сохранен файл: {os.path.basename(output_path)}")
+        say(f"🏷️  По кодам ТН ВЭД: '{matched_codes_str}'")
+        say(f"💾 Сохранен файл: {os.path.basename(output_path)}")
+
+    schema_cache.save()
+    if row_index is not None:
+        row_index.close()
 
+    metrics.finish(written_rows).save(output_folder)
+    write_run_report(output_folder, [metrics.filename])
+    print(f"📈 Метрики: {os.path.join(output_folder, 'metrics.csv')}")
     print("\n✅ Обработка завершена!")
 
 
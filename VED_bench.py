@@ -0,0 +1,274 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+from VED_rules import (
+    EXTRACT_ENGINE, EXTRACT_ENGINES, extract_npk, determine_grade, determine_grade_batch, check_all_less_than_one, check_product_type,
+)
+
+# ======================================
+# Микробенчмарки каскада правил Grade
+# ======================================
+# Замеряет extract_npk, determine_grade (построчно и пакетно), check_all_less_than_one
+# и check_product_type на корпусе описаний G31_1 для каждого набора правил
+# (см. VED_rules.RULESETS): 'full' — VED_folder_BPY, 'basic' — VED_multi и VED_source.
+# Набор, общий для нескольких скриптов, замеряется один раз.
+#
+# Для каждой функции: время одного вызова (лучший из --repeat прогонов),
+# строк в секунду и пик выделенной памяти за прогон (tracemalloc).
+#
+#   python VED_bench.py                    — отчёт
+#   python VED_bench.py --save-baseline    — сохранить результаты как эталон
+#   python VED_bench.py --check            — сравнить с эталоном; код выхода 1 при замедлении
+#   python VED_bench.py --corpus file.xlsx — описания из реальной выгрузки (колонка G31_1)
+#   python VED_bench.py --engine tokens    — замер токенного движка извлечения (VED_tokens)
+#
+# Эталон хранит условия замера (движок, число строк, корпус): --check с другими условиями
+# отказывается сравнивать (код выхода 1), а не сообщает ложные регрессии.
+
+# Набор правил → скрипты, которые его используют
+VARIANTS = {
+    'full': ['VED_folder_BPY'],
+    'basic': ['VED_multi', 'VED_source'],
+}
+
+BASELINE_FILE = './bench_baseline.json'
+DEFAULT_ROWS = 5_000
+DEFAULT_REPEAT = 3
+
+# Допустимое замедление относительно эталона — доля, не проценты (0.2 — на 20%)
+REGRESSION_THRESHOLD = 0.2
+
+PRODUCTS = ['НПК', 'Прочие NP/NPK', 'МАФ', 'Калий', 'NP', 'PK', 'Карбамид', 'AN', 'Нитрат натрия', 'Что-то', None]
+
+# ==== КОРПУС ====
+# Шаблоны описаний по типам: {n}, {p}, {k} — случайные значения, {filler} — «шумовой» текст
+TEMPLATES = {
+    'dash': [
+        'УДОБРЕНИЕ МИНЕРАЛЬНОЕ КОМПЛЕКСНОЕ NPK {n}-{p}-{k} В МЕШКАХ ПО 50 КГ',
+        'азофоска марки {n}-{p}-{k}, гранулированная',
+        'NPK(S) {n}-{p}-{k}(10) ДЛЯ СЕЛЬСКОГО ХОЗЯЙСТВА',
+    ],
+    'ratio': [
+        'УДОБРЕНИЕ NPK {n}:{p}:{k} ВОДОРАСТВОРИМОЕ',
+        'np {n}:{p} аммофос',
+        'NPK {n}:{p}:{k} + МИКРОЭЛЕМЕНТЫ',
+    ],
+    'keywords': [
+        'МАССОВАЯ ДОЛЯ АЗОТА - {n}%, ФОСФОРА {p}%, КАЛИЯ {k}%',
+        'содержание азота {n}, фосфор {p}, калий {k} %',
+        'УДОБРЕНИЕ АЗОТНОЕ, СОДЕРЖАЩИЙ {n} МАС.% АЗОТА',
+    ],
+    'oxides': [
+        'ФОСФОРНЫЙ АНГИДРИД В ПЕРЕСЧЕТЕ НА P2O5 {p}%, K2O - {k}%',
+        'калий хлористый, калия в пересчете на k2o {k}',
+        'МОНОКАЛИЙФОСФАТ P2O5 {p}% K2O {k}%',
+    ],
+    'gost_tu': [
+        'УДОБРЕНИЕ ГОСТ 20432-83 ТУ 2181-073-05761695-2016 NPK {n}-{p}-{k} ГОСТ 2-2013',
+        'ту 20.15.79-001-12345678-2019 гост 2081-2010 азот {n}% 25 кг',
+        'СЕЛИТРА АММИАЧНАЯ ГОСТ 2-2013 МАРКА Б, ТУ 2143-001-2019, 1000 KG, АЗОТ {n}',
+    ],
+    'long': [
+        '{filler} NPK {n}-{p}-{k} {filler}',
+        '{filler} массовая доля азота {n}% {filler} фосфор {p} {filler}',
+    ],
+    'empty': [float('nan'), '', None, 'БЕЗ ЦИФР', '123'],
+}
+
+FILLER = ('ПРОИЗВОДИТЕЛЬ АО "УДОБРЕНИЯ", ТОВАРНЫЙ ЗНАК ОТСУТСТВУЕТ, УПАКОВАНО В БИГ-БЭГИ, '
+          'МАРКИРОВКА НА ЯЩИКАХ, ДЛЯ ПРИМЕНЕНИЯ В СЕЛЬСКОМ ХОЗЯЙСТВЕ, ')
+
+
+def build_corpus(rows=DEFAULT_ROWS, seed=1):
+    """Синтетические описания G31_1 — поровну каждого типа из TEMPLATES."""
+    r = random.Random(seed)
+    kinds = list(TEMPLATES)
+    descriptions = []
+    for i in range(rows):
+        template = r.choice(TEMPLATES[kinds[i % len(kinds)]])
+        if not isinstance(template, str) or '{' not in template:
+            descriptions.append(template)
+            continue
+        descriptions.append(template.format(
+            n=r.choice([r.randint(0, 46), round(r.uniform(0, 46), 1)]),
+            p=r.randint(0, 61),
+            k=r.randint(0, 61),
+            filler=FILLER * r.randint(5, 20),
+        ))
+    return descriptions
+
+
+def load_corpus(path, rows=None):
+    """Описания из колонки G31_1 реальной выгрузки."""
+    import pandas as pd
+
+    df = pd.read_excel(path)
+    col = next((c for c in df.columns if str(c).startswith('G31_1')), None)
+    if col is None:
+        raise KeyError(f"❌ В файле {path} нет колонки G31_1")
+    descriptions = df[col].tolist()
+    return descriptions[:rows] if rows else descriptions
+
+
+# ==== ЗАМЕРЫ ====
+def _time_best(func, items, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for args in items:
+            func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _peak_memory(run):
+    tracemalloc.start()
+    try:
+        run()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure(func, items, repeat=DEFAULT_REPEAT):
+    """func(*args) для каждого args из items: мкс на вызов, строк/с, пик памяти за прогон (байт)."""
+    elapsed = _time_best(func, items, repeat)
+    peak = _peak_memory(lambda: [func(*args) for args in items])
+    return {
+        'us_per_call': elapsed / len(items) * 1e6,
+        'rows_per_sec': len(items) / elapsed if elapsed else float('inf'),
+        'peak_bytes': peak,
+    }
+
+
+def measure_batch(func, args, rows, repeat=DEFAULT_REPEAT):
+    """Пакетная функция func(*args) на всех строках: время пересчитано на одну строку."""
+    result = measure(func, [args], repeat)
+    result['us_per_call'] /= rows
+    result['rows_per_sec'] *= rows
+    return result
+
+
+def bench_variant(ruleset, descriptions, repeat=DEFAULT_REPEAT, engine=None):
+    import pandas as pd
+
+    products = [PRODUCTS[i % len(PRODUCTS)] for i in range(len(descriptions))]
+    pairs = list(zip(descriptions, products))
+    grades = [determine_grade(d, p, ruleset, engine) for d, p in pairs]
+    rows = [({'G31_1': d, 'Product': p}, 'G31_1') for d, p in pairs]
+
+    return {
+        'extract_npk': measure(lambda d: extract_npk(d, ruleset, engine), [(d,) for d in descriptions], repeat),
+        'determine_grade': measure(lambda d, p: determine_grade(d, p, ruleset, engine), pairs, repeat),
+        'determine_grade_batch': measure_batch(
+            lambda d, p: determine_grade_batch(d, p, ruleset, engine),
+            (pd.Series(descriptions, dtype=object), pd.Series(products, dtype=object)), len(descriptions), repeat,
+        ),
+        'check_all_less_than_one': measure(check_all_less_than_one, [(g,) for g in grades], repeat),
+        'check_product_type': measure(check_product_type, rows, repeat),
+    }
+
+
+# ==== ЭТАЛОН ====
+def bench_settings(engine, rows, corpus=None, seed=1):
+    """Условия замера, от которых зависят цифры: движок, число строк, корпус (файл с хэшем или синтетический)."""
+    if corpus:
+        from VED_input_cache import file_hash
+
+        corpus = f'{os.path.basename(corpus)} (sha1 {file_hash(corpus)[:12]})'
+    else:
+        corpus = f'синтетический (seed {seed})'
+    return {'engine': engine or EXTRACT_ENGINE, 'rows': rows, 'corpus': corpus}
+
+
+def settings_mismatch(settings, baseline):
+    """Список (поле, эталон, сейчас) для условий, которые отличаются от эталона."""
+    reference = baseline.get('settings', {})
+    return [(key, reference.get(key), value) for key, value in settings.items() if reference.get(key) != value]
+
+
+def check_regressions(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """Список замедлений: (набор правил, функция, эталон мкс, сейчас мкс)."""
+    slower = []
+    for variant, funcs in results.items():
+        for name, stats in funcs.items():
+            reference = baseline.get(variant, {}).get(name)
+            if reference and stats['us_per_call'] > reference['us_per_call'] * (1 + threshold):
+                slower.append((variant, name, reference['us_per_call'], stats['us_per_call']))
+    return slower
+
+
+def print_report(results, rows):
+    print(f"📏 Корпус: {rows} описаний")
+    for variant, funcs in results.items():
+        print(f"\n🔹 правила '{variant}' ({', '.join(VARIANTS[variant])})")
+        for name, stats in funcs.items():
+            print(f"   {name:<24} {stats['us_per_call']:>9.2f} мкс/вызов  "
+                  f"{stats['rows_per_sec']:>12,.0f} строк/с  пик {stats['peak_bytes'] / 1024:>9.1f} КБ")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Микробенчмарки функций Grade / Product Type")
+    parser.add_argument('--rows', type=int, default=DEFAULT_ROWS, help=f"размер корпуса (по умолчанию {DEFAULT_ROWS})")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help="число прогонов, берётся лучший")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--corpus', help="xlsx с колонкой G31_1 вместо синтетического корпуса")
+    parser.add_argument('--variant', action='append', choices=list(VARIANTS),
+                        help="набор правил для замера (можно несколько; по умолчанию все)")
+    parser.add_argument('--engine', choices=EXTRACT_ENGINES, help="движок извлечения N/P/K (по умолчанию regex)")
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--save-baseline', action='store_true', help="сохранить результаты как эталон")
+    parser.add_argument('--check', action='store_true', help="сравнить с эталоном, код выхода 1 при замедлении")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help=f"допустимое замедление как доля: 0.2 — на 20%% (по умолчанию {REGRESSION_THRESHOLD})")
+    parser.add_argument('--json', help="записать результаты в JSON")
+    args = parser.parse_args(argv)
+
+    descriptions = load_corpus(args.corpus, args.rows) if args.corpus else build_corpus(args.rows, args.seed)
+    results = {
+        variant: bench_variant(variant, descriptions, args.repeat, args.engine)
+        for variant in (args.variant or VARIANTS)
+    }
+    print_report(results, len(descriptions))
+    settings = bench_settings(args.engine, len(descriptions), args.corpus, args.seed)
+    payload = {'settings': settings, 'results': results}
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False, indent=1)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False, indent=1)
+        print(f"\n💾 Эталон сохранён: {args.baseline}")
+
+    if args.check:
+        if not os.path.exists(args.baseline):
+            print(f"\n❌ Нет эталона {args.baseline} — запустите с --save-baseline")
+            return 1
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        mismatch = settings_mismatch(settings, baseline)
+        if mismatch:
+            print(f"\n❌ Эталон {args.baseline} снят в других условиях — сравнение невозможно:")
+            for key, reference, current in mismatch:
+                print(f"   {key}: эталон {reference}, сейчас {current}")
+            print("   Запустите с теми же параметрами или пересохраните эталон (--save-baseline)")
+            return 1
+        slower = check_regressions(results, baseline['results'], args.threshold)
+        if slower:
+            print(f"\n❌ Замедление больше {args.threshold:.0%}:")
+            for variant, name, reference, current in slower:
+                print(f"   {variant}.{name}: {reference:.2f} → {current:.2f} мкс/вызов")
+            return 1
+        print(f"\n✅ Регрессий нет (порог {args.threshold:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,33 @@
+# ======================================
+# Компактное представление выходных таблиц
+# ======================================
+# Колонки с небольшим числом различных значений (код ТН ВЭД, Product, Grade,
+# Product Type) хранятся как pd.Categorical: на строку — целочисленный код
+# (int8/int16), сами значения — один раз в словаре категорий, а не объект-строка
+# в каждой строке.
+# При записи (VED_xlsx.write_excel_batches) категории разворачиваются обратно
+# в исходные значения — выходной файл тот же, меняется только память.
+
+# Категория выгодна, если различных значений не больше этой доли строк
+MAX_UNIQUE_SHARE = 0.5
+
+
+def compact_frame(df, columns):
+    """
+    Переводит колонки columns (отсутствующие пропускаются) в category на месте; возвращает df.
+    Колонки, где различных значений больше MAX_UNIQUE_SHARE строк, остаются как есть.
+    """
+    import pandas as pd
+
+    for column in columns:
+        if column not in df.columns or isinstance(df[column].dtype, pd.CategoricalDtype):
+            continue
+        values = df[column]
+        if values.nunique(dropna=False) <= len(values) * MAX_UNIQUE_SHARE:
+            df[column] = values.astype('category')
+    return df
+
+
+def frame_bytes(df):
+    """Память таблицы в байтах, включая содержимое строк."""
+    return int(df.memory_usage(deep=True).sum())
@@ -1,312 +1,362 @@
-
-
-import pandas as pd
-import re
 import os
+import time
+import argparse
+import hashlib
+
+from VED_rules import (
+    RULES_VERSION, EXTRACT_ENGINES, npk_batch, grade_batch, pregrade_batch, check_product_type_batch,
+)
+from VED_grade_cache import GradeCache
+from VED_parallel import run_in_pool, run_pipeline, row_pool, map_chunks, CHUNK_SIZE, PIPELINE_DEPTH
+from VED_xlsx import read_excel_batches, write_excel_batches, BATCH_SIZE
+from VED_input_cache import read_excel_cached
+from VED_routing import load_reference
+from VED_rule_profile import enable_profiling
+from VED_compact import compact_frame
+from VED_metrics import FileMetrics, write_run_report, progress, say
+from VED_watch import watch_folder, WATCH_INTERVAL, WATCH_DEBOUNCE
+from VED_manifest import load_manifest, update_manifest, input_state, is_up_to_date, deps_for, commit_output
 
 # Папки
 input_folder = './input'
 output_folder = './output'
-os.makedirs(output_folder, exist_ok=True)
 
 # Файл со справочником
 product_file = './Products.xlsx'
 tnved_col = "G33 (код товара по ТН ВЭД РФ)"
-df_product = pd.read_excel(product_file, sheet_name='ВЭД')
-product_map = dict(zip(df_product[tnved_col], df_product['Вид МУ']))
-
-# ==== ФУНКЦИИ ====
-def extract_npk(description):
-    desc = str(description).lower().strip()
-    desc = re.sub(r'[\s\xa0\u3000]+', ' ', desc)
-    # --- удаляем паттерны ГОСТ (разные форматы) ---
-    # Простейшие: ГОСТ 2-2013, ГОСТ 2081-2010
-    desc = re.sub(r'гост\s*\d{1,5}-\d{2,4}', '', desc, flags=re.IGNORECASE)
-    # ГОСТ X–XXXX (равно как и X-XXXX): короткий номер и год
-    desc = re.sub(r'гост\s*\d{1,2}[-–]\d{3,4}', '', desc, flags=re.IGNORECASE)
-    # ГОСТ X–XXXX–XX (доп. суффикс), например ГОСТ 123-456-78
-    desc = re.sub(r'гост\s*\d{1,5}[-–]\d{2,4}[-–]\d{2,4}', '', desc, flags=re.IGNORECASE)
-    # ГОСТ X–XXXX: Часть X
-    desc = re.sub(r'гост\s*\d{1,5}[-–]\d{2,4}\s*:\s*часть\s*\d+', '', desc, flags=re.IGNORECASE)
-    # ГОСТ X–XXXX (XXXX)
-    desc = re.sub(r'гост\s*\d{1,5}[-–]\d{2,4}\s*\(\d{2,4}\)', '', desc, flags=re.IGNORECASE)
-    # На всякий случай: ГОСТ без пробела перед номером (ГОСТ2-2013)
-    desc = re.sub(r'гост\d{1,5}[-–]\d{2,4}', '', desc, flags=re.IGNORECASE)
-
-    # --- удаляем расширенные паттерны ТУ ---
-    desc = re.sub(r'ту\s*\d{4}-\d{3}-\d{8}-\d{4}', '', desc, flags=re.IGNORECASE)  # ТУ 2181-073-05761695-2016
-    desc = re.sub(r'ту\s*\d{2}\.\d{2}\.\d{2}-\d{3}-\d{8}-\d{4}', '', desc, flags=re.IGNORECASE)  # вариант с точками + длинный код
-    desc = re.sub(r'ту\s*\d{2}\.\d{2}\.\d{2}-\d{3}-\d{4}', '', desc)
-    desc = re.sub(r'ту\s*\d{2}\.\d{2}\.\d{2}-\d{4}-\d{4}', '', desc)
-    
-    # --- удаляем количества в килограммах (10 КГ, 10кг, 10 кг, 10Kg, 10.5кг и т.п.) ---
-    # С пробелом или без, целые и десятичные числа, любые регистры букв
-    desc = re.sub(r'(?<!\S)\d+(?:[.,]\d+)?\s*[кk][гg](?!\S)', '', desc, flags=re.IGNORECASE)
-    
-    # 🔹 Приоритет: если есть формат x-x-x, сразу возвращаем
-    dash_grade_match = re.search(
-        r'\b(\d+(?:[.,]\d+)?)\s*-\s*(\d+(?:[.,]\d+)?)\s*-\s*(\d+(?:[.,]\d+)?)\b',
-        desc
-    )
-    if dash_grade_match:
-        try:
-            n = float(dash_grade_match.group(1).replace(',', '.'))
-            p = float(dash_grade_match.group(2).replace(',', '.'))
-            k = float(dash_grade_match.group(3).replace(',', '.'))
-            n = int(n) if n == int(n) else n
-            p = int(p) if p == int(p) else p
-            k = int(k) if k == int(k) else k
-            return {'N': {'value': n}, 'P': {'value': p}, 'K': {'value': k}}
-        except ValueError:
-            pass
-
-    # формат NPK x:x:x или NPK x-x-x или NP(...) x:x
-    npk_match = re.search(
-        r'\b(?:npk|np)\s*(?:\([^)]+\))?\s*(\d+(?:\.\d+)?)\s*[:-]\s*(\d+(?:\.\d+)?)'
-        r'(?:\s*[:-]\s*(\d+(?:\.\d+)?))?',
-        desc, re.IGNORECASE
-    )
-    if npk_match:
-        n = float(npk_match.group(1))
-        p = float(npk_match.group(2))
-        k = float(npk_match.group(3)) if npk_match.group(3) is not None else 0
-        n = int(n) if n <= 100 and n == int(n) else (n if n <= 100 else 0)
-        p = int(p) if p <= 100 and p == int(p) else (p if p <= 100 else 0)
-        k = int(k) if k <= 100 and k == int(k) else (k if k <= 100 else 0)
-        return {'N': {'value': n}, 'P': {'value': p}, 'K': {'value': k}}
-
-    # поиск по ключам
-    elements = {
-        'N': {'keywords': [
-            r'\bазот', r'\bnитрат', r'\bn\s*содержащие', r'\bсодержание\s*азота',
-            r'\bаммонийный\s*азот', r'\bнитрат', r'\bn\s*общий', r'\bаммиачный\s*азот'
-        ], 'value': 0},
-        'P': {'keywords': [
-            r'\bфосфор', r'\bp2o5', r'\bп2о5', r'\bphosphorus',
-            r'\bсодержание\s*фосфора', r'\bфосфаты'
-        ], 'value': 0},
-        'K': {'keywords': [
-            r'\bкали[йяие]', r'\bk2o', r'\bкалийные', r'\bсодержание\s*калия'
-        ], 'value': 0},
-        'Ca': {'keywords': [
-            r'\bкальций', r'\bcao', r'\bca\s*содержащие', r'\bизвесть',
-            r'\bкарбонат\s*кальца', r'\bсодержание\s*кальция', r'\bcacо3'
-        ], 'value': 0}
-    }
-    for el_key, data in elements.items():
-        for keyword in data['keywords']:
-            pattern = rf'{keyword}\D*?(\d+(?:[,.]\d+)?)(?=\s*(?:%|мас|в пересчёте|марка|гост|п/п|кг|л|литров|литра|мешк|пакет|упаковк|порошок|гранулы|таблетк|вес|брутто|нетто|пластик|бумажн|поддон|паллет|предназначен|используется|входит|содержит|состав|марка|не более|не менее|не превышает|минимум|максимум|,|\.|;|:|$))'
-            match = re.search(pattern, desc, re.IGNORECASE)
-            if match:
-                try:
-                    value = float(match.group(1).replace(',', '.'))
-                    if value > 100:
-                        value = 0
-                    data['value'] = int(value) if value == int(value) else value
-                except ValueError:
-                    continue
-                break
 
-    k2o_match = re.search(r'в\sпересч[ёе]те.?k2o\D*(\d+(?:[,.]\d+)?)', desc, re.IGNORECASE)
-    if k2o_match:
-        try:
-            k_value = float(k2o_match.group(1).replace(',', '.'))
-            elements['K']['value'] = int(k_value) if k_value == int(k_value) else k_value
-        except ValueError:
-            pass
-
-    # Новый паттерн: просто "КАЛИЯ В ПЕРЕСЧЕТЕ НА K2O - 50%" или "K2O - 50%"
-    k2o_simple = re.search(r'(?:калия\sв\sпересч[ёе]те\sна\s)?k2o\D*(\d+(?:[,.]\d+)?)', desc, re.IGNORECASE)
-    if k2o_simple and not elements['K']['value']:
-        try:
-            k_value = float(k2o_simple.group(1).replace(',', '.'))
-            elements['K']['value'] = int(k_value) if k_value == int(k_value) else k_value
-        except ValueError:
-            pass
+# Постоянный кэш Grade (None — отключить)
+grade_cache_file = './grade_cache.sqlite'
 
-    p2o5_match = re.search(r'в\sпересч[ёе]те.?p2o5\D*(\d+(?:[,.]\d+)?)', desc, re.IGNORECASE)
-    if p2o5_match:
-        try:
-            p2o5_value = float(p2o5_match.group(1).replace(',', '.'))
-            elements['P']['value'] = int(p2o5_value * 0.436) if (p2o5_value * 0.436) == int(p2o5_value * 0.436) else p2o5_value * 0.436
-        except ValueError:
-            pass
-
-    # Новый паттерн: просто "P2O5 - 46%"
-    p2o5_simple = re.search(r'p2o5\D*(\d+(?:[,.]\d+)?)', desc, re.IGNORECASE)
-    if p2o5_simple and not elements['P']['value']:
-        try:
-            p2_value = float(p2o5_simple.group(1).replace(',', '.'))
-            elements['P']['value'] = int(p2_value * 0.436) if (p2_value * 0.436) == int(p2_value * 0.436) else p2_value * 0.436
-        except ValueError:
-            pass
-
-    # Поиск фосфорного ангидрида
-    p_anhydride = re.search(r'фосфорн\w*\sангидрид\D*(\d+(?:[,.]\d+)?)', desc, re.IGNORECASE)
-    if p_anhydride and not elements['P']['value']:
-        try:
-            p_val = float(p_anhydride.group(1).replace(',', '.'))
-            elements['P']['value'] = p_val
-        except ValueError:
-            pass
-
-    # Новый паттерн: "МАССОВАЯ ДОЛЯ АЗОТА - 18%"
-    n_mass = re.search(r'азот\w*\D*(\d+(?:[,.]\d+)?)', desc, re.IGNORECASE)
-    if n_mass and not elements['N']['value']:
-        try:
-            n_val = float(n_mass.group(1).replace(',', '.'))
-            elements['N']['value'] = n_val
-        except ValueError:
-            pass
-
-    # Новый паттерн для "СОДЕРЖАЩИЙ 46,2 МАС.% АЗОТА"
-    n_contains = re.search(r'содерж\w*\D*(\d+(?:[,.]\d+)?)\s*мас\.?%[^а-я]*азот', desc, re.IGNORECASE)
-    if n_contains and not elements['N']['value']:
-        try:
-            n_val = float(n_contains.group(1).replace(',', '.'))
-            elements['N']['value'] = n_val
-        except ValueError:
-            pass
-    # 🔹 Дополнительные паттерны для азота (N)
-    if not elements['N']['value']:
-        extra_n_patterns = [
-            r'азот\w*[^0-9]{0,10}(\d+(?:[.,]\d+)?)\s*%?',
-            r'содерж\w*[^0-9]{0,10}(\d+(?:[.,]\d+)?)\s*мас\.?%[^а-я]*азот',
-            r'азот\w*\D*(\d+(?:[,.]\d+)?)',
-            r'содерж\w*\D*(\d+(?:[,.]\d+)?)\s*мас\.?%[^а-я]*азот'
-        ]
-        for pat in extra_n_patterns:
-            m = re.search(pat, desc, re.IGNORECASE)
-            if m:
-                try:
-                    n_val = float(m.group(1).replace(',', '.'))
-                    if n_val <= 100:
-                        elements['N']['value'] = int(n_val) if n_val == int(n_val) else n_val
-                        break
-                except ValueError:
-                    pass
-
-    # 🔹 Дополнительные паттерны для P2O5 (P)
-    if not elements['P']['value']:
-        extra_p_patterns = [
-            r'p2o5\D*(\d+(?:[.,]\d+)?)',
-            r'фосфорн\w*\sангидрид\D*(\d+(?:[,.]\d+)?)',
-            r'в\sпересч[ёе]те.?p2o5\D*(\d+(?:[,.]\d+)?)'
-        ]
-        for pat in extra_p_patterns:
-            m = re.search(pat, desc, re.IGNORECASE)
-            if m:
-                try:
-                    p_val = float(m.group(1).replace(',', '.'))
-                    if p_val <= 100:
-                        # перевод P2O5 → P при необходимости
-                        if 'p2o5' in pat.lower():
-                            p_val = p_val * 0.436
-                        elements['P']['value'] = int(p_val) if p_val == int(p_val) else p_val
-                        break
-                except ValueError:
-                    pass
-
-    # 🔹 Дополнительные паттерны для K2O (K)
-    if not elements['K']['value']:
-        extra_k_patterns = [
-            r'калия\sв\sпересч[ёе]те\sна\sk2o\D*(\d+(?:[,.]\d+)?)',
-            r'k2o\D*(\d+(?:[,.]\d+)?)',
-            r'в\sпересч[ёе]те.?k2o\D*(\d+(?:[,.]\d+)?)',
-            r'(?:калия\sв\sпересч[ёе]те\sна\s)?k2o\D*(\d+(?:[,.]\d+)?)'
-        ]
-        for pat in extra_k_patterns:
-            m = re.search(pat, desc, re.IGNORECASE)
-            if m:
-                try:
-                    k_val = float(m.group(1).replace(',', '.'))
-                    if k_val <= 100:
-                        elements['K']['value'] = int(k_val) if k_val == int(k_val) else k_val
-                        break
-                except ValueError:
-                    pass
-
-    return {k: v for k, v in elements.items()}
-
-
-
-def determine_grade(description, product):
-    result = extract_npk(description)
-    n = result['N']['value']
-    p = result['P']['value']
-    k = result['K']['value']
-
-    n = n if isinstance(n, (int, float)) and 0 < n <= 100 else 0
-    p = p if isinstance(p, (int, float)) and 0 < p <= 100 else 0
-    k = k if isinstance(k, (int, float)) and 0 < k <= 100 else 0
-
-    if product == 'Калий':
-        n = 0; p = 0
-    elif product == 'NP':
-        k = 0
-    elif product == 'PK':
-        n = 0
-    elif product == 'NS':
-        p = 0; k = 0
-    elif product == 'Ca':
-        n = 0; p = 0; k = 0
-
-    n = int(n) if isinstance(n, float) and n == int(n) else n
-    p = int(p) if isinstance(p, float) and p == int(p) else p
-    k = int(k) if isinstance(k, float) and k == int(k) else k
-
-    grade = f"{n}-{p}-{k}"
-    return "X-X-X" if grade == "0-0-0" else grade
-
-def check_all_less_than_one(grade):
-    if not grade or grade == 'X-X-X':
-        return grade
-    parts = grade.split('-')
-    try:
-        nums = [float(x) for x in parts]
-        if all(x < 1 for x in nums):
-            return ''
-    except ValueError:
-        pass
-    return grade
-
-def check_product_type(row, desc_col):
-    if row['Product'] in ['НПК', 'Прочие NP/NPK']:
-        if pd.notna(row[desc_col]) and re.search(r'водорастворим\w*', str(row[desc_col]).lower()):
-            return 'ВРУ'
-    return ''
-
-allowed_product_types = {
-    "НПК","МАФ","Карбамид","Прочие удобрения животного или растительного происхождения",
-    "Прочие фосфорные удобрения","PK","CAN","AN","Прочие NP/NPK",
-    "НПК в таблетках или упаковке менее 10 кг","AS","КАС","Калий",
-    "SOP","ДАФ","NP","Нитрат натрия","NS","CN",
-    "Прочие калийные удобрения","Удобрения животного или растительного происхождения",
-    "Прочие суперфосфаты","Суперфосфаты"
-}
+# Кэш разобранных входных книг в Parquet (None — отключить)
+input_cache_dir = './.input_cache'
 
-# ==== ЦИКЛ ====
-files = [f for f in os.listdir(input_folder) if f.lower().endswith('.xlsx')]
-for i, fname in enumerate(files, 1):
-    in_path = os.path.join(input_folder, fname)
-    out_path = os.path.join(output_folder, f"{os.path.splitext(fname)[0]} SORTING.xlsx")
+# Движок извлечения N/P/K: 'regex' (каскад регулярных выражений) или 'tokens' (VED_tokens) — результат один
+grade_engine = 'regex'
 
-    df_source = pd.read_excel(in_path)
+# Компактные таблицы: код ТН ВЭД, Product, Grade и Product Type — как category (меньше памяти)
+compact_frames = False
+
+# Параллельная обработка строк внутри одного файла (для очень больших книг)
+row_workers = 1
+chunk_size = CHUNK_SIZE
+
+# Потоковое чтение входных файлов блоками строк (None — читать файл целиком)
+batch_size = None
+
+# Конвейер по файлам: чтение / расчёт / запись в разных потоках (0 — выключен);
+# число — глубина очередей между этапами (сколько таблиц может ждать своей очереди)
+pipeline_depth = 0
+
+# Зависимости результата для манифеста ./output/manifest.json (заполняются в main)
+run_deps = None
+
+# Справочник и кэш загружаются один раз на процесс (см. init_worker)
+product_map = None
+grade_cache = None
+
+
+# ==== ИНИЦИАЛИЗАЦИЯ ====
+def init_worker(settings=None):
+    global product_map, grade_cache
+    # Настройки запуска передаются явно — в дочерних процессах (spawn) глобальные переменные не наследуются
+    globals().update(settings or {})
+    # Справочник как префиксный индекс (точный код или самый длинный совпавший префикс);
+    # пары «код → Вид МУ» берутся из кэша, пока Products.xlsx не изменился
+    product_map = load_reference(product_file, tnved_col, 'Вид МУ', sheet_name='ВЭД', cache_dir=input_cache_dir)
+    grade_cache = GradeCache(grade_cache_file) if grade_cache_file else None
+
+
+# ==== ОБРАБОТКА ФАЙЛА ====
+def grade_frame(df_source, pool=None, metrics=None):
     if "G31_1 (Описание и характеристика товара)" not in df_source.columns:
         raise KeyError("❌ Нет колонки 'G31_1 (Описание и характеристика товара)'")
+    metrics = metrics or FileMetrics(None)
+
+    # Колонки добавляются прямо в прочитанную таблицу — без копии исходных данных
+    with metrics.stage('product', len(df_source)):
+        df_new = df_source
+        df_new['Product'] = product_map.route(df_new[tnved_col])
+    desc = df_new["G31_1 (Описание и характеристика товара)"]
+
+    def npk_rows(descriptions, ruleset='full'):
+        return map_chunks(npk_batch, [descriptions], pool, chunk_size, ruleset=ruleset, engine=grade_engine)
+
+    with metrics.stage('grade', len(df_new)):
+        # Строки с Product не из списка разрешённых и описания без цифр получают итог сразу
+        grades, todo = pregrade_batch(desc, df_new['Product'])
+        metrics.count_pregraded(len(todo) - int(todo.sum()))
+        if todo.any():
+            # N/P/K — числами (из кэша или по правилам); обнуление по Product, правило «все < 1»
+            # и сборка строки Grade — векторно по всем строкам сразу
+            if grade_cache is not None:
+                values = grade_cache.values(desc[todo], compute=npk_rows)
+            else:
+                values = npk_rows(desc[todo])
+            grades[todo] = grade_batch(values, df_new['Product'][todo], below_one=True)
+        df_new['Grade'] = grades
+    metrics.count_grades(df_new['Grade'])
+
+    with metrics.stage('product_type', len(df_new)):
+        df_new['Product Type'] = check_product_type_batch(desc, df_new['Product'])
+
+    if compact_frames:
+        compact_frame(df_new, [tnved_col, 'Product', 'Grade', 'Product Type'])
+    metrics.count_memory(df_new)
+    return df_new
+
+
+def read_file(fname, metrics):
+    in_path = os.path.join(input_folder, fname)
+    with metrics.stage('read'):
+        df_source = read_excel_cached(in_path, cache_dir=input_cache_dir)
+    metrics.add('read', 0, len(df_source))
+    return df_source
 
-    df_new = df_source.copy()
-    df_new['Product'] = df_new[tnved_col].map(product_map)
 
-    df_new['Grade'] = df_new.apply(lambda r: determine_grade(r["G31_1 (Описание и характеристика товара)"], r['Product']), axis=1)
-    df_new['Grade'] = df_new.apply(lambda r: r['Grade'] if r['Product'] in allowed_product_types else '', axis=1)
-    df_new['Grade'] = df_new['Grade'].apply(check_all_less_than_one)
+def write_file(fname, batches, metrics):
+    in_path = os.path.join(input_folder, fname)
+    out_path = os.path.join(output_folder, f"{os.path.splitext(fname)[0]} SORTING.xlsx")
 
-    df_new['Product Type'] = df_new.apply(check_product_type, axis=1, desc_col="G31_1 (Описание и характеристика товара)")
+    manifest = load_manifest(output_folder)
+    tmp_path = out_path + '.part'
+    digest = hashlib.sha1()
+    with metrics.stage('write'):
+        rows = write_excel_batches(tmp_path, batches, sheet_name='Лист 1', digest=digest)
+    metrics.add('write', 0, rows)
+
+    # Файл перезаписывается, только если изменились данные
+    commit_output(tmp_path, out_path, digest.hexdigest(), manifest)
+    previous = manifest.get(os.path.basename(out_path), {})
+    update_manifest(output_folder, os.path.basename(out_path), {
+        'input': input_state(in_path, previous.get('input')),
+        'deps': run_deps,
+        'output_sha1': digest.hexdigest(),
+        'rows': rows,
+    })
+    metrics.finish(rows).save(output_folder)
+    return out_path
+
+
+def process_file(fname):
+    metrics = FileMetrics(fname)
+    with row_pool(row_workers) as pool:
+        if batch_size:
+            # Потоковый режим: блок читается, обрабатывается и сразу дописывается в выходной файл
+            in_path = os.path.join(input_folder, fname)
+            batches = (grade_frame(batch, pool, metrics)
+                       for batch in metrics.timed('read', read_excel_batches(in_path, batch_size)))
+        else:
+            batches = [grade_frame(read_file(fname, metrics), pool, metrics)]
+        return write_file(fname, batches, metrics)
+
+
+def pipeline_read(fname):
+    metrics = FileMetrics(fname)
+    return read_file(fname, metrics), metrics
+
+
+def pipeline_write(fname, result):
+    df_new, metrics = result
+    return write_file(fname, [df_new], metrics)
+
+
+def init_settings(settings):
+    # Процессы чтения и записи конвейера: только настройки запуска, без справочника и кэша Grade
+    globals().update(settings)
+
+
+def process_pipelined(files):
+    """
+    Конвейер по файлам (VED_parallel.run_pipeline): чтение следующей книги и запись
+    предыдущей идут в отдельных процессах, пока текущая считается здесь.
+    """
+    with row_pool(row_workers) as pool:
+        def grade(fname, data):
+            df_source, metrics = data
+            return grade_frame(df_source, pool, metrics), metrics
+
+        return run_pipeline(pipeline_read, grade, pipeline_write, files, pipeline_depth,
+                            initializer=init_settings, initargs=({'run_deps': run_deps},))
+
+
+def pending_files(files):
+    """Файлы, у которых вход или зависимости (справочник, правила) изменились с прошлой обработки."""
+    manifest = load_manifest(output_folder)
+    pending = []
+    for f in files:
+        # Файл могли удалить или переименовать после того, как его нашли (временный файл заменён итоговым)
+        try:
+            if not is_up_to_date(manifest, os.path.join(input_folder, f),
+                                 os.path.join(output_folder, f"{os.path.splitext(f)[0]} SORTING.xlsx"), run_deps):
+                pending.append(f)
+        except OSError as e:
+            say(f"⚠️ {f} пропущен: {e}")
+    return pending
+
+
+# ==== РЕЖИМ НАБЛЮДЕНИЯ ====
+# Процесс не завершается: справочник, кэш Grade и скомпилированные правила загружены один раз,
+# и задержка на файл — только его обработка. Смена Products.xlsx перечитывает справочник.
+def watch_input(interval=WATCH_INTERVAL, debounce=WATCH_DEBOUNCE, force=False):
+    init_worker()
+    # Прогрев: первый расчёт подгружает pandas / numpy и движок извлечения
+    npk_batch(['npk 16-16-16'], engine=grade_engine)
+    reference = [os.stat(product_file).st_mtime_ns]
+    # Файлы, обработанные за время наблюдения, — для сводки metrics.json / metrics.csv
+    processed = {}
+
+    # Последняя ошибка чтения справочника — чтобы не повторять её в консоли на каждом опросе
+    reference_error = [None]
+
+    def check_reference(watcher):
+        global product_map, run_deps
+        # Справочник пропал или Excel его ещё сохраняет — работаем со старым и пробуем на следующем опросе;
+        # reference[0] обновляется только после успешной загрузки
+        try:
+            mtime = os.stat(product_file).st_mtime_ns
+            if mtime == reference[0]:
+                return
+            new_map = load_reference(product_file, tnved_col, 'Вид МУ', sheet_name='ВЭД', cache_dir=input_cache_dir)
+            new_deps = deps_for('VED_folder_BPY', product_file, RULES_VERSION['full'])
+        except Exception as e:
+            if str(e) != reference_error[0]:
+                reference_error[0] = str(e)
+                say(f"⚠️ Справочник {product_file} не прочитан, используется прежний: {e}")
+            return
+        reference[0], reference_error[0] = mtime, None
+        product_map, run_deps = new_map, new_deps
+        say("🔁 Справочник изменился — файлы будут пересчитаны")
+        watcher.reset()
+
+    def handle(names):
+        nonlocal force
+        files = names if force else pending_files(names)
+        force = False
+        if not files:
+            return
+        if pipeline_depth and not batch_size and len(files) > 1:
+            process_pipelined(files)
+        else:
+            for fname in files:
+                start = time.perf_counter()
+                try:
+                    out_path = process_file(fname)
+                except Exception as e:
+                    say(f"❌ Ошибка при обработке файла {fname}: {e}")
+                    continue
+                say(f"✅ {fname} → {out_path} ({time.perf_counter() - start:.1f} с)")
+        processed.update(dict.fromkeys(files))
+        write_run_report(output_folder, list(processed))
 
-    with pd.ExcelWriter(out_path, engine='openpyxl') as writer:
-        df_new.to_excel(writer, sheet_name='Лист 1', index=False)
+    try:
+        watch_folder(input_folder, handle, interval, debounce, before_poll=check_reference)
+    finally:
+        if grade_cache is not None:
+            print(f"🗄️ Кэш Grade: {grade_cache.hits} из кэша, {grade_cache.misses} вычислено")
+            grade_cache.close()
 
-    print(f"✅ {i}/{len(files)} готово → {out_path}")
 
-print("🎯 Все файлы обработаны!")
+# ==== ЦИКЛ ====
+def main(argv=None):
+    global row_workers, chunk_size, batch_size, run_deps, grade_cache_file, grade_engine, compact_frames, pipeline_depth
+    parser = argparse.ArgumentParser(description="Product / Grade / Product Type для всех *.xlsx из ./input")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="число процессов для параллельной обработки файлов (по умолчанию 1)")
+    parser.add_argument('--row-workers', type=int, default=row_workers,
+                        help="число процессов для обработки строк одного файла блоками (только без --workers)")
+    parser.add_argument('--chunk-size', type=int, default=chunk_size,
+                        help=f"размер блока строк для --row-workers (по умолчанию {CHUNK_SIZE})")
+    parser.add_argument('--stream', action='store_true',
+                        help="читать входные файлы потоково (openpyxl read_only) блоками строк")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help=f"размер блока строк для --stream (по умолчанию {BATCH_SIZE})")
+    parser.add_argument('--force', action='store_true',
+                        help="обработать все файлы, даже если вход и зависимости не изменились")
+    parser.add_argument('--profile-rules', action='store_true',
+                        help="статистика срабатывания и время каждого правила Grade (один процесс, без кэша Grade)")
+    parser.add_argument('--engine', choices=EXTRACT_ENGINES, default=grade_engine,
+                        help=f"движок извлечения N/P/K (по умолчанию {grade_engine})")
+    parser.add_argument('--compact', action='store_true', default=compact_frames,
+                        help="хранить код ТН ВЭД, Product, Grade и Product Type как category (меньше памяти)")
+    parser.add_argument('--pipeline', action='store_true',
+                        help="конвейер: следующий файл читается, а предыдущий пишется, пока текущий считается")
+    parser.add_argument('--queue-depth', type=int, default=pipeline_depth or PIPELINE_DEPTH,
+                        help=f"глубина очередей конвейера, таблиц (по умолчанию {PIPELINE_DEPTH})")
+    parser.add_argument('--watch', action='store_true',
+                        help="не завершаться: обрабатывать новые и изменённые файлы ./input по мере появления")
+    parser.add_argument('--interval', type=float, default=WATCH_INTERVAL,
+                        help=f"--watch: период опроса папки, с (по умолчанию {WATCH_INTERVAL:g})")
+    parser.add_argument('--debounce', type=float, default=WATCH_DEBOUNCE,
+                        help=f"--watch: файл берётся в работу, если не менялся столько секунд (по умолчанию {WATCH_DEBOUNCE:g})")
+    args = parser.parse_args(argv)
+    if args.pipeline and (args.stream or args.workers > 1):
+        parser.error("--pipeline не сочетается с --stream и --workers")
+    if args.watch and (args.workers > 1 or args.profile_rules):
+        parser.error("--watch не сочетается с --workers и --profile-rules")
+
+    if args.profile_rules:
+        # Профиль собирается в этом процессе, и каждое описание должно пройти каскад
+        args.workers = args.row_workers = 1
+        grade_cache_file = None
+
+    chunk_size = args.chunk_size
+    batch_size = args.batch_size if args.stream else None
+    grade_engine = args.engine
+    compact_frames = args.compact
+    pipeline_depth = args.queue_depth if args.pipeline else pipeline_depth
+
+    os.makedirs(output_folder, exist_ok=True)
+    files = [f for f in os.listdir(input_folder) if f.lower().endswith('.xlsx')]
+
+    # Инкрементальный запуск: пропускаем файлы с неизменными входом и зависимостями
+    run_deps = deps_for('VED_folder_BPY', product_file, RULES_VERSION['full'])
+
+    if args.watch:
+        row_workers = args.row_workers
+        watch_input(args.interval, args.debounce, args.force)
+        return
+
+    if not args.force:
+        pending = pending_files(files)
+        if len(pending) < len(files):
+            print(f"⏭️ Без изменений, пропущено файлов: {len(files) - len(pending)}")
+            files = pending
+
+    if not files:
+        print("🎯 Все файлы обработаны!")
+        return
+
+    if args.workers > 1:
+        # Ядра уже заняты файлами — строки внутри файла обрабатываются последовательно
+        row_workers = 1
+        settings = {'row_workers': row_workers, 'chunk_size': chunk_size, 'batch_size': batch_size,
+                    'run_deps': run_deps, 'grade_engine': grade_engine, 'compact_frames': compact_frames}
+        run_in_pool(process_file, files, args.workers, initializer=init_worker, initargs=(settings,))
+    else:
+        row_workers = args.row_workers
+        init_worker()
+        profile = enable_profiling() if args.profile_rules else None
+        if pipeline_depth and not batch_size:
+            process_pipelined(files)
+        else:
+            for i, fname in enumerate(progress(files, desc="Файлы"), 1):
+                out_path = process_file(fname)
+                say(f"✅ {i}/{len(files)} готово → {out_path}")
+
+        if profile is not None:
+            profile.report()
+            profile.to_csv(os.path.join(output_folder, 'rule_profile.csv'))
+            print(f"💾 Профиль правил: {os.path.join(output_folder, 'rule_profile.csv')}")
+
+        if grade_cache is not None:
+            print(f"🗄️ Кэш Grade: {grade_cache.hits} из кэша, {grade_cache.misses} вычислено")
+            grade_cache.close()
+
+    write_run_report(output_folder, files)
+    print(f"📈 Метрики: {os.path.join(output_folder, 'metrics.csv')}")
+    print("🎯 Все файлы обработаны!")
+
+
+if __name__ == "__main__":
+    main()
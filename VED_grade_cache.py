@@ -0,0 +1,117 @@
+import hashlib
+import sqlite3
+import time
+
+from VED_rules import SPACES, RULES_VERSION, npk_batch
+
+# ======================================
+# Постоянный кэш N/P/K на диске (SQLite)
+# ======================================
+# Ключ: (нормализованное описание, версия набора правил) → значения N, P, K.
+# Grade из них собирается векторно (VED_rules.grade_batch) с учётом Product,
+# поэтому Product в ключ не входит: одно описание — одна запись.
+# При изменении правил в VED_rules.py меняется RULES_VERSION, и устаревшие
+# записи удаляются при открытии кэша. Размер ограничен max_entries:
+# лишние записи вытесняются по давности последнего использования (LRU).
+
+GRADE_CACHE_FILE = './grade_cache.sqlite'
+MAX_ENTRIES = 1_000_000
+
+# Ограничение SQLite на число параметров в одном запросе
+_CHUNK = 900
+
+
+def clean_description(description):
+    """
+    Нормализация описания для ключа кэша — та же, с которой начинает extract_npk.
+    """
+    return SPACES.sub(' ', str(description).lower().strip())
+
+
+def _chunks(items, size=_CHUNK):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class GradeCache:
+    def __init__(self, path=GRADE_CACHE_FILE, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # timeout: несколько процессов (--workers) пишут в один файл кэша
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS npk (key TEXT PRIMARY KEY, version TEXT NOT NULL, '
+            'n REAL NOT NULL, p REAL NOT NULL, k REAL NOT NULL, used REAL NOT NULL)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS npk_used ON npk (used)')
+        # Кэш прежнего формата (готовые Grade по описанию и Product)
+        self.conn.execute('DROP TABLE IF EXISTS grades')
+        # Автоматическая инвалидация: оставляем только записи текущих версий правил
+        versions = sorted(set(RULES_VERSION.values()))
+        self.conn.execute(
+            f'DELETE FROM npk WHERE version NOT IN ({",".join("?" * len(versions))})', versions
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def _key(version, description):
+        raw = f'{version}\x00{description}'
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def _lookup(self, keys):
+        found = {}
+        for chunk in _chunks(keys):
+            rows = self.conn.execute(
+                f'SELECT key, n, p, k FROM npk WHERE key IN ({",".join("?" * len(chunk))})', chunk
+            )
+            found.update((key, values) for key, *values in rows)
+        return found
+
+    def _evict(self):
+        count = self.conn.execute('SELECT COUNT(*) FROM npk').fetchone()[0]
+        if count > self.max_entries:
+            self.conn.execute(
+                'DELETE FROM npk WHERE key IN (SELECT key FROM npk ORDER BY used LIMIT ?)',
+                (count - self.max_entries,)
+            )
+
+    def values(self, descriptions, ruleset='full', compute=npk_batch):
+        """
+        Возвращает массив строк × 3 (N, P, K) для описаний, считая только отсутствующие в кэше.
+        compute(descriptions, ruleset) — функция расчёта промахов (список троек).
+        """
+        import numpy as np
+
+        version = RULES_VERSION[ruleset]
+        descs = [clean_description(d) for d in descriptions]
+
+        # Уникальные описания: одинаковые строки внутри файла считаются один раз
+        keys = {desc: self._key(version, desc) for desc in dict.fromkeys(descs)}
+        found = self._lookup(list(keys.values()))
+
+        now = time.time()
+        result = {desc: found[key] for desc, key in keys.items() if key in found}
+        missing = [desc for desc in keys if desc not in result]
+        computed = compute(missing, ruleset) if missing else []
+        result.update(zip(missing, computed))
+        new_rows = [(keys[desc], version, *values, now) for desc, values in zip(missing, computed)]
+        self.hits += len(keys) - len(new_rows)
+        self.misses += len(new_rows)
+
+        self.conn.executemany('UPDATE npk SET used = ? WHERE key = ?', ((now, found_key) for found_key in found))
+        self.conn.executemany('INSERT OR REPLACE INTO npk VALUES (?, ?, ?, ?, ?, ?)', new_rows)
+        self._evict()
+        self.conn.commit()
+
+        return np.array([result[desc] for desc in descs], dtype=float).reshape(-1, 3)
@@ -0,0 +1,210 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+
+from VED_metrics import say
+
+# ======================================
+# Кэш разобранных входных книг (Parquet)
+# ======================================
+# Разбор .xlsx — самый медленный шаг. При первом чтении DataFrame сохраняется
+# в CACHE_DIR, повторные запуски читают его оттуда. Запись кэша привязана к
+# пути файла и параметрам чтения; рядом хранится JSON с размером, mtime и
+# SHA-1 содержимого книги:
+#   - размер и mtime совпали          → читаем кэш без хэширования;
+#   - изменились, но хэш тот же       → обновляем метаданные, читаем кэш;
+#   - хэш другой                      → разбираем .xlsx заново.
+# Если pyarrow недоступен или таблицу нельзя записать в Parquet (смешанные
+# типы в колонке), используется pickle — с предупреждением в консоли. Ошибки диска
+# и прав доступа (OSError) не подменяются pickle, а передаются дальше.
+#
+# Очистка: python VED_input_cache.py --clear | --prune [--max-size-mb N] | --stats
+#
+# pandas импортируется только при чтении данных: file_hash и обслуживание кэша
+# (а через них VED_manifest) работают без него.
+
+CACHE_DIR = './.input_cache'
+MAX_CACHE_BYTES = 2 * 1024 ** 3
+
+
+def file_hash(path):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def _entry_key(path, read_kwargs):
+    raw = json.dumps([os.path.abspath(path), read_kwargs], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def write_json(path, data):
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _parquet_errors():
+    # Ожидаемые отказы Parquet: нет pyarrow, колонку нельзя сериализовать (смешанные типы)
+    errors = (ImportError, ValueError, TypeError)
+    try:
+        import pyarrow
+    except ImportError:
+        return errors
+    return errors + (pyarrow.ArrowException,)
+
+
+def _save_frame(df, base):
+    """Сохраняет DataFrame в Parquet (или pickle, если Parquet невозможен); возвращает имя файла."""
+    data_file = base + '.parquet'
+    tmp = f'{data_file}.{os.getpid()}.tmp'
+    try:
+        df.to_parquet(tmp, index=True)
+    except OSError:
+        # Нет места, нет прав — это не повод молча перейти на pickle
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    except _parquet_errors() as e:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        say(f"⚠️ Кэш {os.path.basename(base)}: Parquet недоступен ({type(e).__name__}: {e}), сохраняется pickle")
+        data_file = base + '.pkl'
+        tmp = f'{data_file}.{os.getpid()}.tmp'
+        df.to_pickle(tmp)
+    os.replace(tmp, data_file)
+    return os.path.basename(data_file)
+
+
+def _load_frame(data_file):
+    import pandas as pd
+
+    if data_file.endswith('.parquet'):
+        return pd.read_parquet(data_file)
+    return pd.read_pickle(data_file)
+
+
+def read_excel_cached(path, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES, **read_kwargs):
+    """
+    pd.read_excel(path, **read_kwargs) с кэшированием результата в cache_dir.
+    """
+    import pandas as pd
+
+    if not cache_dir:
+        return pd.read_excel(path, **read_kwargs)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    base = os.path.join(cache_dir, _entry_key(path, read_kwargs))
+    meta_file = base + '.json'
+    stat = os.stat(path)
+
+    meta = None
+    if os.path.exists(meta_file):
+        try:
+            with open(meta_file, encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = None
+
+    if meta is not None:
+        data_file = os.path.join(cache_dir, meta['data'])
+        same_stat = meta['size'] == stat.st_size and meta['mtime_ns'] == stat.st_mtime_ns
+        if os.path.exists(data_file) and (same_stat or meta['sha1'] == file_hash(path)):
+            if not same_stat:
+                meta.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+            meta['used'] = time.time()
+            write_json(meta_file, meta)
+            return _load_frame(data_file)
+
+    df = pd.read_excel(path, **read_kwargs)
+    meta = {
+        'path': os.path.abspath(path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha1': file_hash(path),
+        'data': _save_frame(df, base),
+        'used': time.time(),
+    }
+    write_json(meta_file, meta)
+    prune(cache_dir, max_bytes)
+    return df
+
+
+# ==== ОБСЛУЖИВАНИЕ КЭША ====
+def _entries(cache_dir):
+    """Записи кэша: (последнее использование, json, файл данных, размер данных)."""
+    entries = []
+    if not os.path.isdir(cache_dir):
+        return entries
+    for name in os.listdir(cache_dir):
+        if not name.endswith('.json'):
+            continue
+        meta_file = os.path.join(cache_dir, name)
+        try:
+            with open(meta_file, encoding='utf-8') as f:
+                meta = json.load(f)
+            data_file = os.path.join(cache_dir, meta['data'])
+            size = os.path.getsize(data_file) if os.path.exists(data_file) else 0
+        except (OSError, ValueError, KeyError):
+            continue
+        entries.append((meta.get('used', 0), meta_file, data_file, size))
+    return entries
+
+
+def prune(cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+    """Удаляет давно не использованные записи, пока размер кэша больше max_bytes."""
+    entries = sorted(_entries(cache_dir))
+    total = sum(size for *_, size in entries)
+    removed = 0
+    for _, meta_file, data_file, size in entries:
+        if total <= max_bytes:
+            break
+        # С --workers ту же запись может удалить соседний процесс
+        for file in (meta_file, data_file):
+            try:
+                os.remove(file)
+            except FileNotFoundError:
+                pass
+        total -= size
+        removed += 1
+    return removed
+
+
+def clear(cache_dir=CACHE_DIR):
+    removed = 0
+    if os.path.isdir(cache_dir):
+        for name in os.listdir(cache_dir):
+            try:
+                os.remove(os.path.join(cache_dir, name))
+            except FileNotFoundError:
+                continue
+            removed += 1
+    return removed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Обслуживание кэша разобранных входных книг")
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument('--clear', action='store_true', help="удалить весь кэш")
+    parser.add_argument('--prune', action='store_true', help="сократить кэш до --max-size-mb")
+    parser.add_argument('--max-size-mb', type=float, default=MAX_CACHE_BYTES / 1024 ** 2)
+    parser.add_argument('--stats', action='store_true', help="показать размер кэша")
+    args = parser.parse_args(argv)
+
+    if args.clear:
+        print(f"🧹 Удалено файлов: {clear(args.cache_dir)}")
+    if args.prune:
+        print(f"🧹 Удалено записей: {prune(args.cache_dir, int(args.max_size_mb * 1024 ** 2))}")
+    if args.stats or not (args.clear or args.prune):
+        entries = _entries(args.cache_dir)
+        total = sum(size for *_, size in entries)
+        print(f"🗄️ {args.cache_dir}: записей {len(entries)}, {total / 1024 ** 2:.1f} МБ")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import json
+import os
+import time
+
+from VED_input_cache import file_hash
+
+# ======================================
+# Манифест запусков для инкрементальной обработки папки
+# ======================================
+# ./output/manifest.json хранит для каждого выходного файла SORTING.xlsx:
+#   - входной файл: размер, mtime, SHA-1;
+#   - зависимости: SHA-1 справочника Products.xlsx, версия правил, скрипт;
+#   - SHA-1 записанных данных (заголовок + строки).
+# Файл пропускается, если вход и зависимости не изменились, а выход на месте.
+# Выходной файл перезаписывается, только если изменилось его содержимое.
+
+MANIFEST_NAME = 'manifest.json'
+
+
+def manifest_path(output_folder):
+    return os.path.join(output_folder, MANIFEST_NAME)
+
+
+def load_manifest(output_folder):
+    try:
+        with open(manifest_path(output_folder), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+class _ManifestLock:
+    """Простая межпроцессная блокировка через файл (для --workers)."""
+
+    def __init__(self, output_folder, timeout=60):
+        self.path = manifest_path(output_folder) + '.lock'
+        self.timeout = timeout
+
+    def __enter__(self):
+        while True:
+            try:
+                self.fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                return self
+            except FileExistsError:
+                pass
+            # Блокировка держится доли секунды; старше timeout — зависла от упавшего процесса.
+            # Её могли снять между проверками — тогда просто пробуем снова
+            try:
+                if time.time() - os.path.getmtime(self.path) > self.timeout:
+                    os.remove(self.path)
+                    continue
+            except FileNotFoundError:
+                continue
+            time.sleep(0.05)
+
+    def __exit__(self, *exc):
+        os.close(self.fd)
+        os.remove(self.path)
+
+
+def update_manifest(output_folder, out_name, entry):
+    """Записывает запись для одного выходного файла (безопасно при параллельных процессах)."""
+    with _ManifestLock(output_folder):
+        manifest = load_manifest(output_folder)
+        manifest[out_name] = entry
+        tmp = f'{manifest_path(output_folder)}.{os.getpid()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, manifest_path(output_folder))
+
+
+def input_state(in_path, previous=None):
+    """
+    Размер, mtime и SHA-1 входного файла. Если размер и mtime совпадают с прошлой записью,
+    хэш берётся из неё — без повторного чтения файла.
+    """
+    stat = os.stat(in_path)
+    if previous and previous.get('size') == stat.st_size and previous.get('mtime_ns') == stat.st_mtime_ns:
+        sha1 = previous['sha1']
+    else:
+        sha1 = file_hash(in_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha1': sha1}
+
+
+def is_up_to_date(manifest, in_path, out_path, deps):
+    entry = manifest.get(os.path.basename(out_path))
+    if not entry or entry.get('deps') != deps or not os.path.exists(out_path):
+        return False
+    return input_state(in_path, entry.get('input'))['sha1'] == entry['input']['sha1']
+
+
+def deps_for(script, product_file, rules_version):
+    return {'script': script, 'products': file_hash(product_file), 'rules': rules_version}
+
+
+def commit_output(tmp_path, out_path, data_sha1, manifest):
+    """
+    Переносит tmp_path в out_path, если данные отличаются от записанных ранее.
+    Возвращает True, если выходной файл был перезаписан.
+    """
+    entry = manifest.get(os.path.basename(out_path))
+    if entry and entry.get('output_sha1') == data_sha1 and os.path.exists(out_path):
+        os.remove(tmp_path)
+        return False
+    os.replace(tmp_path, out_path)
+    return True
@@ -0,0 +1,309 @@
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# ======================================
+# Метрики обработки файлов и индикатор прогресса
+# ======================================
+# Для каждого входного файла собираются этапы: read, product, grade, product_type, write —
+# время, число строк, строк/с и пик памяти (RSS) за время этапа — peak_rss_mb (способ
+# измерения — rss_method, см. «Память этапов»); у файла — наибольший пик его этапов.
+# Отдельно — память готовой таблицы в байтах на строку (bytes_per_row).
+# Этапы могут быть вложенными (в потоковом режиме чтение и расчёт идут внутри записи):
+# у внешнего этапа учитывается только собственное время.
+#
+# Результат: ./output/metrics/<файл>.json для каждого файла и сводка запуска
+# ./output/metrics.json + ./output/metrics.csv.
+
+METRICS_DIR = 'metrics'
+CSV_FIELDS = ['file', 'stage', 'seconds', 'rows', 'rows_per_sec', 'peak_rss_mb', 'rss_method', 'xxx', 'blank',
+              'pregraded', 'bytes_per_row']
+
+
+# ==== ПАМЯТЬ ЭТАПОВ ====
+# rss_method — как измерен peak_rss_mb:
+#   'hwm'      — Linux: в начале этапа пик процесса сбрасывается (запись "5" в /proc/self/clear_refs),
+#                в конце читается VmHWM из /proc/self/status;
+#   'sampled'  — текущий RSS (psutil или /proc/self/statm) опрашивается фоновым потоком
+#                раз в RSS_SAMPLE_INTERVAL с;
+#   'lifetime' — есть только максимум с запуска процесса (resource.getrusage): это не память
+#                этапа, в долгоживущем процессе он может относиться к одному из прошлых файлов;
+#   None       — измерить нечем.
+# Сброс пика общий для процесса, поэтому перед каждым сбросом и в конце каждого этапа текущий
+# пик засчитывается всем открытым этапам — вложенным и из других потоков конвейера.
+
+RSS_SAMPLE_INTERVAL = 0.01
+
+
+def _status_mb(field):
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _reset_hwm():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _current_rss_mb():
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _lifetime_peak_mb():
+    # Модуля resource нет вне POSIX (Windows)
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss в Linux — в КБ, в macOS — в байтах
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+class _PeakTracker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Открытые этапы: номер → пик RSS с начала этапа, МБ
+        self._open = {}
+        self._next = 0
+        self._sampler = None
+        if _reset_hwm() and _status_mb('VmHWM:') is not None:
+            self.method = 'hwm'
+        elif _current_rss_mb() is not None:
+            self.method = 'sampled'
+        elif _lifetime_peak_mb() is not None:
+            self.method = 'lifetime'
+        else:
+            self.method = None
+
+    def _peak(self):
+        if self.method == 'hwm':
+            return _status_mb('VmHWM:')
+        if self.method == 'sampled':
+            return _current_rss_mb()
+        if self.method == 'lifetime':
+            return _lifetime_peak_mb()
+        return None
+
+    def _fold(self, value):
+        if value is None:
+            return
+        for token, peak in self._open.items():
+            if peak is None or value > peak:
+                self._open[token] = value
+
+    def start(self):
+        with self._lock:
+            self._fold(self._peak())
+            if self.method == 'hwm':
+                _reset_hwm()
+            token = self._next
+            self._next += 1
+            self._open[token] = self._peak()
+            if self.method == 'sampled' and self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample, daemon=True)
+                self._sampler.start()
+        return token
+
+    def stop(self, token):
+        with self._lock:
+            self._fold(self._peak())
+            return self._open.pop(token)
+
+    def _sample(self):
+        while True:
+            time.sleep(RSS_SAMPLE_INTERVAL)
+            with self._lock:
+                if not self._open:
+                    self._sampler = None
+                    return
+                self._fold(_current_rss_mb())
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+
+def _peaks():
+    # Способ измерения определяется при первом этапе, а не при импорте
+    global _tracker
+    with _tracker_lock:
+        if _tracker is None:
+            _tracker = _PeakTracker()
+    return _tracker
+
+
+class FileMetrics:
+    def __init__(self, filename):
+        self.filename = filename
+        self.stages = {}
+        self.rows = 0
+        self.xxx = 0
+        self.blank = 0
+        # Строк с итоговым Grade без каскада правил (VED_rules.pregrade_batch)
+        self.pregraded = 0
+        # Память готовых таблиц (в потоковом режиме — сумма по блокам) и число их строк
+        self.frame_bytes = 0
+        self.frame_rows = 0
+        self._started = time.perf_counter()
+        self._stack = []
+        self.seconds = None
+
+    @contextmanager
+    def stage(self, name, rows=0):
+        self._stack.append(0.0)
+        token = _peaks().start()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            peak = _peaks().stop(token)
+            nested = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += elapsed
+            self.add(name, elapsed - nested, rows, peak)
+
+    def add(self, name, seconds, rows=0, peak_rss_mb=None):
+        stat = self.stages.setdefault(name, {'seconds': 0.0, 'rows': 0, 'peak_rss_mb': None})
+        stat['seconds'] += seconds
+        stat['rows'] += rows
+        if peak_rss_mb is not None and (stat['peak_rss_mb'] is None or peak_rss_mb > stat['peak_rss_mb']):
+            stat['peak_rss_mb'] = peak_rss_mb
+
+    def timed(self, name, batches):
+        """Итерация по блокам с учётом времени получения каждого блока как этапа name."""
+        batches = iter(batches)
+        while True:
+            with self.stage(name):
+                batch = next(batches, None)
+            if batch is None:
+                return
+            self.add(name, 0, len(batch))
+            yield batch
+
+    def count_grades(self, grades):
+        self.xxx += int((grades == 'X-X-X').sum())
+        self.blank += int((grades == '').sum())
+
+    def count_pregraded(self, rows):
+        self.pregraded += rows
+
+    def count_memory(self, df):
+        from VED_compact import frame_bytes
+
+        self.frame_bytes += frame_bytes(df)
+        self.frame_rows += len(df)
+
+    def finish(self, rows):
+        self.seconds = time.perf_counter() - self._started
+        self.rows = rows
+        return self
+
+    def to_dict(self):
+        stages = {
+            name: dict(stat, rows_per_sec=stat['rows'] / stat['seconds'] if stat['seconds'] else None)
+            for name, stat in self.stages.items()
+        }
+        peaks = [stat['peak_rss_mb'] for stat in self.stages.values() if stat['peak_rss_mb'] is not None]
+        return {
+            'file': self.filename,
+            'rows': self.rows,
+            'seconds': self.seconds,
+            'rows_per_sec': self.rows / self.seconds if self.seconds else None,
+            'peak_rss_mb': max(peaks) if peaks else None,
+            'rss_method': _peaks().method,
+            'xxx': self.xxx,
+            'blank': self.blank,
+            'pregraded': self.pregraded,
+            'bytes_per_row': self.frame_bytes / self.frame_rows if self.frame_rows else None,
+            'stages': stages,
+        }
+
+    def save(self, output_folder):
+        folder = os.path.join(output_folder, METRICS_DIR)
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, f'{self.filename}.json'), 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=1)
+
+
+def write_run_report(output_folder, filenames):
+    """Сводка запуска по файлам filenames: metrics.json и metrics.csv в output_folder."""
+    records = []
+    for filename in filenames:
+        try:
+            with open(os.path.join(output_folder, METRICS_DIR, f'{filename}.json'), encoding='utf-8') as f:
+                records.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+
+    with open(os.path.join(output_folder, 'metrics.json'), 'w', encoding='utf-8') as f:
+        json.dump(records, f, ensure_ascii=False, indent=1)
+
+    with open(os.path.join(output_folder, 'metrics.csv'), 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        for record in records:
+            for name, stat in record['stages'].items():
+                writer.writerow({'file': record['file'], 'stage': name, 'seconds': stat['seconds'],
+                                 'rows': stat['rows'], 'rows_per_sec': stat['rows_per_sec'],
+                                 'peak_rss_mb': stat.get('peak_rss_mb'), 'rss_method': record.get('rss_method')})
+            writer.writerow({'file': record['file'], 'stage': 'total', 'seconds': record['seconds'],
+                             'rows': record['rows'], 'rows_per_sec': record['rows_per_sec'],
+                             'peak_rss_mb': record.get('peak_rss_mb'), 'rss_method': record.get('rss_method'),
+                             'xxx': record['xxx'],
+                             'blank': record['blank'], 'pregraded': record.get('pregraded'),
+                             'bytes_per_row': record.get('bytes_per_row')})
+    return records
+
+
+# ==== ПРОГРЕСС ====
+# tqdm — необязательная зависимость: без неё строки статуса просто печатаются.
+
+def progress(iterable=None, total=None, desc=None, unit='файл'):
+    try:
+        from tqdm import tqdm
+    except ImportError:
+        return iterable if iterable is not None else _NoProgress()
+    return tqdm(iterable, total=total, desc=desc, unit=unit, dynamic_ncols=True)
+
+
+def say(message):
+    """Печать строки статуса, не ломая индикатор прогресса."""
+    try:
+        from tqdm import tqdm
+    except ImportError:
+        print(message)
+        return
+    tqdm.write(message)
+
+
+class _NoProgress:
+    def update(self, n=1):
+        pass
+
+    def close(self):
+        pass
@@ -1,6 +1,17 @@
-import pandas as pd
-import re
 import os
+import argparse
+import hashlib
+
+from VED_rules import RULES_VERSION, EXTRACT_ENGINES, npk_batch, grade_batch, pregrade_batch
+from VED_grade_cache import GradeCache
+from VED_parallel import run_in_pool, run_pipeline, print_summary, row_pool, map_chunks, CHUNK_SIZE, PIPELINE_DEPTH
+from VED_xlsx import read_excel_batches, write_excel_batches, BATCH_SIZE
+from VED_input_cache import read_excel_cached
+from VED_routing import load_reference
+from VED_rule_profile import enable_profiling
+from VED_compact import compact_frame
+from VED_metrics import FileMetrics, write_run_report, progress, say
+from VED_manifest import load_manifest, update_manifest, input_state, is_up_to_date, deps_for, commit_output
 
 # === Функция поиска колонки по префиксу ===
 def find_column(df, prefix):
@@ -21,213 +32,275 @@ OUTPUT_FOLDER = './output'
 tnved_col_prefix = "G33"
 desc_col_prefix = "G31_1"
 
-# === Загружаем справочник ТН ВЭД -> Вид МУ ===
+# === Справочник ТН ВЭД -> Вид МУ ===
 product_file = './Products.xlsx'
-df_product = pd.read_excel(product_file, sheet_name='ВЭД')
-
-# Находим правильные имена колонок в справочнике
-tnved_col_real = find_column(df_product, tnved_col_prefix)
-product_map = dict(zip(df_product[tnved_col_real], df_product['Вид МУ']))
-
-# === Создаём папку для готовых файлов, если её нет ===
-os.makedirs(OUTPUT_FOLDER, exist_ok=True)
-
-
-# === Функция extract_npk (без изменений) ===
-def extract_npk(description):
-    desc = str(description).lower().strip()
-    desc = re.sub(r'[\s\xa0\u3000]+', ' ', desc)
-
-    npk_match = re.search(
-        r'\b(?:npk\s*)?(\d+(?:\.\d+)?)\s*[:-]\s*(\d+(?:\.\d+)?)\s*[:-]\s*(\d+(?:\.\d+)?)',
-        desc, re.IGNORECASE)
-    if npk_match:
-        n = float(npk_match.group(1))
-        p = float(npk_match.group(2))
-        k = float(npk_match.group(3))
-
-        n = int(n) if n <= 100 and n == int(n) else (n if n <= 100 else 0)
-        p = int(p) if p <= 100 and p == int(p) else (p if p <= 100 else 0)
-        k = int(k) if k <= 100 and k == int(k) else (k if k <= 100 else 0)
-
-        return {
-            'N': {'value': n},
-            'P': {'value': p},
-            'K': {'value': k}
-        }
-
-    elements = {
-        'N': {
-            'keywords': [
-                r'\bазот', r'\bnитрат', r'\bn\s*содержащие', r'\bсодержание\s*азота',
-                r'\bаммонийный\s*азот', r'\bнитрат', r'\bn\s*общий', r'\bаммиачный\s*азот'
-            ],
-            'value': 0
-        },
-        'P': {
-            'keywords': [
-                r'\bфосфор', r'\bp2o5', r'\bп2о5', r'\bphosphorus',
-                r'\bсодержание\s*фосфора', r'\bфосфаты'
-            ],
-            'value': 0
-        },
-        'K': {
-            'keywords': [
-                r'\bкали[йяие]', r'\bk2o', r'\bкалийные', r'\bсодержание\s*калия'
-            ],
-            'value': 0
-        },
-        'Ca': {
-            'keywords': [
-                r'\bкальций', r'\bcao', r'\bca\s*содержащие', r'\bизвесть',
-                r'\bкарбонат\s*кальца', r'\bсодержание\s*кальция', r'\bcacо3'
-            ],
-            'value': 0
-        }
-    }
-
-    for el_key, data in elements.items():
-        for keyword in data['keywords']:
-            pattern = rf'{keyword}\D*?(\d+(?:[,.]\d+)?)(?=\s*(?:%|мас|в пересчёте|гост|п/п|кг|л|литров|литра|мешк|пакет|упаковк|порошок|гранулы|таблетк|вес|брутто|нетто|пластик|бумажн|поддон|паллет|предназначен|используется|входит|содержит|состав|марка|не более|не менее|не превышает|минимум|максимум|,|\.|;|:|$))'
-            match = re.search(pattern, desc, re.IGNORECASE)
-            if match:
-                try:
-                    value = float(match.group(1).replace(',', '.'))
-                    if value > 100:
-                        value = 0
-                    data['value'] = int(value) if value == int(value) else value
-                except ValueError:
-                    continue
-                break
-
-    k2o_match = re.search(r'в\s*пересч[ёе]те.*?k2o\D*(\d+(?:[,.]\d+)?)', desc, re.IGNORECASE)
-    if k2o_match:
-        try:
-            k_value = float(k2o_match.group(1).replace(',', '.'))
-            elements['K']['value'] = int(k_value) if k_value == int(k_value) else k_value
-        except ValueError:
-            pass
-
-    p2o5_match = re.search(r'в\s*пересч[ёе]те.*?p2o5\D*(\d+(?:[,.]\d+)?)', desc, re.IGNORECASE)
-    if p2o5_match:
-        try:
-            p2o5_value = float(p2o5_match.group(1).replace(',', '.'))
-            elements['P']['value'] = int(p2o5_value * 0.436) if (p2o5_value * 0.436) == int(p2o5_value * 0.436) else p2o5_value * 0.436
-        except ValueError:
-            pass
-
-    total_n_match = re.search(r'(?:содержание|содержит|общий|содержание азота).*?(\d+(?:[,.]\d+)?)', desc, re.IGNORECASE)
-    if total_n_match:
-        try:
-            n_value = float(total_n_match.group(1).replace(',', '.'))
-            elements['N']['value'] = int(n_value) if n_value == int(n_value) else n_value
-        except ValueError:
-            pass
-
-    return {k: v for k, v in elements.items()}
-
-
-# === Функция determine_grade (без изменений) ===
-def determine_grade(description, product):
-    result = extract_npk(description)
-
-    n = result['N']['value']
-    p = result['P']['value']
-    k = result['K']['value']
-
-    n = n if isinstance(n, (int, float)) and n > 0 and n <= 100 else 0
-    p = p if isinstance(p, (int, float)) and p > 0 and p <= 100 else 0
-    k = k if isinstance(k, (int, float)) and k > 0 and k <= 100 else 0
-
-    if product == 'Калий':
-        n = 0
-        p = 0
-    elif product == 'NP':
-        k = 0
-    elif product == 'PK':
-        n = 0
-    elif product == 'NS':
-        p = 0
-        k = 0
-    elif product == 'Ca':
-        n = 0
-        p = 0
-        k = 0
-
-    n = int(n) if isinstance(n, float) and n == int(n) else n
-    p = int(p) if isinstance(p, float) and p == int(p) else p
-    k = int(k) if isinstance(k, float) and k == int(k) else k
-
-    grade = f"{n}-{p}-{k}"
-
-    return "X-X-X" if grade == "0-0-0" else grade
-
-
-# === Список разрешённых типов продуктов ===
-allowed_product_types = {
-    "НПК",
-    "МАФ",
-    "Карбамид",
-    "Прочие удобрения животного или растительного происхождения",
-    "Прочие фосфорные удобрения",
-    "PK",
-    "CAN",
-    "AN",
-    "Прочие NP/NPK",
-    "НПК в таблетках или упаковке менее 10 кг",
-    "AS",
-    "КАС",
-    "Калий",
-    "SOP",
-    "ДАФ",
-    "NP",
-    "Нитрат натрия",
-    "NS",
-    "CN",
-    "Прочие калийные удобрения",
-    "Удобрения животного или растительного происхождения",
-    "Прочие суперфосфаты",
-    "Суперфосфаты"
-}
-
-# === СПИСОК ФАЙЛОВ ===
-source_files = [f for f in os.listdir(SOURCE_FOLDER) if f.endswith('.xlsx')]
-total_files = len(source_files)
-
-# === ОСНОВНОЙ ЦИКЛ ПО ФАЙЛАМ ===
-for i, filename in enumerate(source_files, start=1):
-    source_file = os.path.join(SOURCE_FOLDER, filename)
-    output_file = os.path.join(OUTPUT_FOLDER, f"{os.path.splitext(filename)[0]} SORTING.xlsx")
-
-    try:
-        # Загружаем исходные данные
-        df_source = pd.read_excel(source_file)
-
-        # Находим нужные колонки по префиксу
-        tnved_col_real = find_column(df_source, tnved_col_prefix)
-        desc_col_real = find_column(df_source, desc_col_prefix)
-
-        # Добавляем колонку Product
-        df_new = df_source.copy()
-        df_new['Product'] = df_new[tnved_col_real].map(product_map)
 
-        # Добавляем Grade
-        df_new['Grade'] = df_new.apply(
-            lambda row: determine_grade(row[desc_col_real], row['Product']), axis=1
-        )
-
-        # Очищаем Grade, если Product не в списке разрешённых
-        df_new['Grade'] = df_new.apply(
-            lambda row: row['Grade'] if row['Product'] in allowed_product_types else '',
-            axis=1
-        )
+# === Постоянный кэш Grade (None — отключить) ===
+GRADE_CACHE_FILE = './grade_cache.sqlite'
+
+# === Кэш разобранных входных книг в Parquet (None — отключить) ===
+INPUT_CACHE_DIR = './.input_cache'
+
+# === Движок извлечения N/P/K: 'regex' (каскад регулярных выражений) или 'tokens' (VED_tokens) ===
+GRADE_ENGINE = 'regex'
+
+# === Компактные таблицы: код ТН ВЭД, Product и Grade — как category (меньше памяти) ===
+COMPACT_FRAMES = False
+
+# === Параллельная обработка строк внутри одного файла (для очень больших книг) ===
+ROW_WORKERS = 1
+CHUNK_SIZE_ROWS = CHUNK_SIZE
+
+# === Потоковое чтение входных файлов блоками строк (None — читать файл целиком) ===
+BATCH_SIZE_ROWS = None
+
+# === Конвейер по файлам: чтение / расчёт / запись в разных потоках (0 — выключен; число — глубина очередей) ===
+PIPELINE_DEPTH_FILES = 0
+
+# === Зависимости результата для манифеста ./output/manifest.json (заполняются в main) ===
+RUN_DEPS = None
+
+# Справочник и кэш загружаются один раз на процесс (см. init_worker)
+product_map = None
+grade_cache = None
+
+
+# === Инициализация процесса: справочник, кэш и настройки запуска ===
+def init_worker(settings=None):
+    global product_map, grade_cache
+    # Настройки передаются явно — в дочерних процессах (spawn) глобальные переменные не наследуются
+    globals().update(settings or {})
+    # Справочник как префиксный индекс (колонка кодов — по префиксу); пары «код → Вид МУ»
+    # берутся из кэша, пока Products.xlsx не изменился
+    product_map = load_reference(product_file, tnved_col_prefix, 'Вид МУ', sheet_name='ВЭД', cache_dir=INPUT_CACHE_DIR)
+    grade_cache = GradeCache(GRADE_CACHE_FILE) if GRADE_CACHE_FILE else None
+
+
+# === Product и Grade для таблицы (или блока строк) ===
+def grade_frame(df_source, pool=None, metrics=None):
+    # Находим нужные колонки по префиксу
+    tnved_col_real = find_column(df_source, tnved_col_prefix)
+    desc_col_real = find_column(df_source, desc_col_prefix)
+    metrics = metrics or FileMetrics(None)
+
+    # Добавляем колонку Product (прямо в прочитанную таблицу — без копии исходных данных)
+    with metrics.stage('product', len(df_source)):
+        df_new = df_source
+        df_new['Product'] = product_map.route(df_new[tnved_col_real])
+
+    # Добавляем Grade (блоками в пуле процессов, если задан ROW_WORKERS > 1)
+    def npk_rows(descriptions, ruleset='basic'):
+        return map_chunks(npk_batch, [descriptions], pool, CHUNK_SIZE_ROWS, ruleset=ruleset, engine=GRADE_ENGINE)
+
+    with metrics.stage('grade', len(df_new)):
+        # Grade пустой, если Product не в списке разрешённых, и X-X-X для описаний без цифр — без расчёта
+        grades, todo = pregrade_batch(df_new[desc_col_real], df_new['Product'])
+        metrics.count_pregraded(len(todo) - int(todo.sum()))
+        if todo.any():
+            # N/P/K — числами (из кэша или по правилам), строка Grade собирается векторно
+            desc = df_new[desc_col_real][todo]
+            if grade_cache is not None:
+                values = grade_cache.values(desc, ruleset='basic', compute=npk_rows)
+            else:
+                values = npk_rows(desc)
+            grades[todo] = grade_batch(values, df_new['Product'][todo])
+        df_new['Grade'] = grades
+    metrics.count_grades(df_new['Grade'])
+
+    if COMPACT_FRAMES:
+        compact_frame(df_new, [tnved_col_real, 'Product', 'Grade'])
+    metrics.count_memory(df_new)
+    return df_new
+
+
+# === Чтение исходной таблицы целиком ===
+def read_file(filename, metrics):
+    source_file = os.path.join(SOURCE_FOLDER, filename)
+    with metrics.stage('read'):
+        df_source = read_excel_cached(source_file, cache_dir=INPUT_CACHE_DIR)
+    metrics.add('read', 0, len(df_source))
+    return df_source
 
-        # Сохраняем в новый файл
-        df_new.to_excel(output_file, sheet_name='Лист 1', index=False)
 
-        # === Вывод прогресса ===
-        progress = (i / total_files) * 100
-        print(f"✅ [{i}/{total_files}] ({progress:.1f}%) Обработано: {filename} → {os.path.basename(output_file)}")
+# === Запись результата, манифест и метрики ===
+def write_file(filename, batches, metrics):
+    source_file = os.path.join(SOURCE_FOLDER, filename)
+    output_file = os.path.join(OUTPUT_FOLDER, f"{os.path.splitext(filename)[0]} SORTING.xlsx")
 
-    except Exception as e:
-        print(f"❌ [{i}/{total_files}] ({(i / total_files) * 100:.1f}%) Ошибка при обработке файла {filename}: {e}")
+    manifest = load_manifest(OUTPUT_FOLDER)
+    tmp_file = output_file + '.part'
+    digest = hashlib.sha1()
+
+    # Сохраняем в новый файл (write_only — без построения книги в памяти)
+    with metrics.stage('write'):
+        rows = write_excel_batches(tmp_file, batches, sheet_name='Лист 1', digest=digest)
+    metrics.add('write', 0, rows)
+
+    # Файл перезаписывается, только если изменились данные
+    commit_output(tmp_file, output_file, digest.hexdigest(), manifest)
+    previous = manifest.get(os.path.basename(output_file), {})
+    update_manifest(OUTPUT_FOLDER, os.path.basename(output_file), {
+        'input': input_state(source_file, previous.get('input')),
+        'deps': RUN_DEPS,
+        'output_sha1': digest.hexdigest(),
+        'rows': rows,
+    })
+    metrics.finish(rows).save(OUTPUT_FOLDER)
+    return output_file
+
+
+# === Обработка одного файла ===
+def process_file(filename):
+    metrics = FileMetrics(filename)
+    with row_pool(ROW_WORKERS) as pool:
+        if BATCH_SIZE_ROWS:
+            # Потоковый режим: блок читается, обрабатывается и сразу дописывается в выходной файл
+            source_file = os.path.join(SOURCE_FOLDER, filename)
+            batches = (grade_frame(batch, pool, metrics)
+                       for batch in metrics.timed('read', read_excel_batches(source_file, BATCH_SIZE_ROWS)))
+        else:
+            batches = [grade_frame(read_file(filename, metrics), pool, metrics)]
+        return write_file(filename, batches, metrics)
+
+
+# === Конвейер: следующий файл читается, предыдущий пишется, пока текущий считается ===
+def pipeline_read(filename):
+    metrics = FileMetrics(filename)
+    return read_file(filename, metrics), metrics
+
+
+def pipeline_write(filename, result):
+    df_new, metrics = result
+    return write_file(filename, [df_new], metrics)
+
+
+def init_settings(settings):
+    # Процессы чтения и записи конвейера: только настройки запуска, без справочника и кэша Grade
+    globals().update(settings)
+
+
+def process_pipelined(files):
+    with row_pool(ROW_WORKERS) as pool:
+        def grade(filename, data):
+            df_source, metrics = data
+            return grade_frame(df_source, pool, metrics), metrics
+
+        return run_pipeline(pipeline_read, grade, pipeline_write, files, PIPELINE_DEPTH_FILES,
+                            initializer=init_settings, initargs=({'RUN_DEPS': RUN_DEPS},))
+
+
+def main(argv=None):
+    global ROW_WORKERS, CHUNK_SIZE_ROWS, BATCH_SIZE_ROWS, RUN_DEPS, GRADE_CACHE_FILE, GRADE_ENGINE, COMPACT_FRAMES, PIPELINE_DEPTH_FILES
+    parser = argparse.ArgumentParser(description="Product / Grade для всех *.xlsx из ./input")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="число процессов для параллельной обработки файлов (по умолчанию 1)")
+    parser.add_argument('--row-workers', type=int, default=ROW_WORKERS,
+                        help="число процессов для обработки строк одного файла блоками (только без --workers)")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE_ROWS,
+                        help=f"размер блока строк для --row-workers (по умолчанию {CHUNK_SIZE})")
+    parser.add_argument('--stream', action='store_true',
+                        help="читать входные файлы потоково (openpyxl read_only) блоками строк")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help=f"размер блока строк для --stream (по умолчанию {BATCH_SIZE})")
+    parser.add_argument('--force', action='store_true',
+                        help="обработать все файлы, даже если вход и зависимости не изменились")
+    parser.add_argument('--profile-rules', action='store_true',
+                        help="статистика срабатывания и время каждого правила Grade (один процесс, без кэша Grade)")
+    parser.add_argument('--engine', choices=EXTRACT_ENGINES, default=GRADE_ENGINE,
+                        help=f"движок извлечения N/P/K (по умолчанию {GRADE_ENGINE})")
+    parser.add_argument('--compact', action='store_true', default=COMPACT_FRAMES,
+                        help="хранить код ТН ВЭД, Product и Grade как category (меньше памяти)")
+    parser.add_argument('--pipeline', action='store_true',
+                        help="конвейер: следующий файл читается, а предыдущий пишется, пока текущий считается")
+    parser.add_argument('--queue-depth', type=int, default=PIPELINE_DEPTH_FILES or PIPELINE_DEPTH,
+                        help=f"глубина очередей конвейера, таблиц (по умолчанию {PIPELINE_DEPTH})")
+    args = parser.parse_args(argv)
+    if args.pipeline and (args.stream or args.workers > 1):
+        parser.error("--pipeline не сочетается с --stream и --workers")
+
+    # === Профиль правил собирается в этом процессе, и каждое описание должно пройти каскад ===
+    if args.profile_rules:
+        args.workers = args.row_workers = 1
+        GRADE_CACHE_FILE = None
+
+    CHUNK_SIZE_ROWS = args.chunk_size
+    BATCH_SIZE_ROWS = args.batch_size if args.stream else None
+    GRADE_ENGINE = args.engine
+    COMPACT_FRAMES = args.compact
+    PIPELINE_DEPTH_FILES = args.queue_depth if args.pipeline else PIPELINE_DEPTH_FILES
+
+    # === Создаём папку для готовых файлов, если её нет ===
+    os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+
+    # === СПИСОК ФАЙЛОВ ===
+    source_files = [f for f in os.listdir(SOURCE_FOLDER) if f.endswith('.xlsx')]
+
+    # === Инкрементальный запуск: пропускаем файлы с неизменными входом и зависимостями ===
+    RUN_DEPS = deps_for('VED_multi', product_file, RULES_VERSION['basic'])
+    if not args.force:
+        manifest = load_manifest(OUTPUT_FOLDER)
+        skipped = [
+            f for f in source_files
+            if is_up_to_date(manifest, os.path.join(SOURCE_FOLDER, f),
+                             os.path.join(OUTPUT_FOLDER, f"{os.path.splitext(f)[0]} SORTING.xlsx"), RUN_DEPS)
+        ]
+        if skipped:
+            print(f"⏭️ Без изменений, пропущено файлов: {len(skipped)}")
+            source_files = [f for f in source_files if f not in skipped]
+    total_files = len(source_files)
+
+    # === Обрабатывать нечего — справочник и кэш не загружаем ===
+    if not source_files:
+        print_summary(total_files, [])
+        return
+
+    if args.workers > 1:
+        # Ядра уже заняты файлами — строки внутри файла обрабатываются последовательно
+        ROW_WORKERS = 1
+        settings = {'ROW_WORKERS': ROW_WORKERS, 'CHUNK_SIZE_ROWS': CHUNK_SIZE_ROWS, 'BATCH_SIZE_ROWS': BATCH_SIZE_ROWS,
+                    'RUN_DEPS': RUN_DEPS, 'GRADE_ENGINE': GRADE_ENGINE, 'COMPACT_FRAMES': COMPACT_FRAMES}
+        run_in_pool(process_file, source_files, args.workers, initializer=init_worker, initargs=(settings,))
+        write_run_report(OUTPUT_FOLDER, source_files)
+        print(f"📈 Метрики: {os.path.join(OUTPUT_FOLDER, 'metrics.csv')}")
+        return
+
+    ROW_WORKERS = args.row_workers
+    init_worker()
+    profile = enable_profiling() if args.profile_rules else None
+
+    # === ОСНОВНОЙ ЦИКЛ ПО ФАЙЛАМ ===
+    if PIPELINE_DEPTH_FILES and not BATCH_SIZE_ROWS:
+        # Прогресс и сводку по файлам печатает run_pipeline
+        errors = None
+        process_pipelined(source_files)
+    else:
+        errors = []
+        for i, filename in enumerate(progress(source_files, desc="Файлы"), start=1):
+            try:
+                output_file = process_file(filename)
+
+                # === Вывод прогресса ===
+                percent = (i / total_files) * 100
+                say(f"✅ [{i}/{total_files}] ({percent:.1f}%) Обработано: {filename} → {os.path.basename(output_file)}")
+
+            except Exception as e:
+                errors.append((filename, str(e)))
+                say(f"❌ [{i}/{total_files}] ({(i / total_files) * 100:.1f}%) Ошибка при обработке файла {filename}: {e}")
+
+    if grade_cache is not None:
+        print(f"🗄️ Кэш Grade: {grade_cache.hits} из кэша, {grade_cache.misses} вычислено")
+        grade_cache.close()
+
+    if profile is not None:
+        profile.report()
+        profile.to_csv(os.path.join(OUTPUT_FOLDER, 'rule_profile.csv'))
+        print(f"💾 Профиль правил: {os.path.join(OUTPUT_FOLDER, 'rule_profile.csv')}")
+
+    write_run_report(OUTPUT_FOLDER, source_files)
+    print(f"📈 Метрики: {os.path.join(OUTPUT_FOLDER, 'metrics.csv')}")
+    if errors is not None:
+        print_summary(total_files, errors)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+
+from VED_metrics import progress, say
+
+# ======================================
+# Параллельная обработка файлов в пуле процессов
+# ======================================
+
+
+def run_in_pool(process_file, files, workers, initializer=None, initargs=()):
+    """
+    Выполняет process_file(filename) для каждого файла в пуле процессов.
+    initializer(*initargs) вызывается один раз в каждом процессе (справочник, кэш, правила, настройки).
+    Прогресс (индикатор с оценкой времени) обновляется по мере завершения файлов; ошибки не прерывают обработку.
+    Возвращает (список готовых файлов, список (файл, ошибка)).
+    """
+    total_files = len(files)
+    done = []
+    errors = []
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as pool:
+        futures = {pool.submit(process_file, filename): filename for filename in files}
+        for i, future in enumerate(progress(as_completed(futures), total=total_files, desc="Файлы"), start=1):
+            filename = futures[future]
+            percent = (i / total_files) * 100
+            try:
+                output_file = future.result()
+                done.append(output_file)
+                say(f"✅ [{i}/{total_files}] ({percent:.1f}%) Обработано: {filename} → {os.path.basename(output_file)}")
+            except Exception as e:
+                errors.append((filename, str(e)))
+                say(f"❌ [{i}/{total_files}] ({percent:.1f}%) Ошибка при обработке файла {filename}: {e}")
+
+    print_summary(total_files, errors)
+    return done, errors
+
+
+def print_summary(total_files, errors):
+    print(f"\n📊 Итого: {total_files - len(errors)} из {total_files} файлов обработано, ошибок: {len(errors)}")
+    for filename, error in errors:
+        print(f"   ❌ {filename}: {error}")
+
+
+# ======================================
+# Параллельная обработка строк одного файла по блокам
+# ======================================
+# Для очень больших книг (сотни тысяч строк) колонки режутся на блоки по
+# chunk_size строк, блоки обрабатываются в пуле, а результаты склеиваются
+# в исходном порядке строк (pool.map сохраняет порядок заданий).
+
+CHUNK_SIZE = 50_000
+
+
+@contextmanager
+def row_pool(workers):
+    """
+    Пул процессов для обработки блоков строк; при workers <= 1 — None (без пула).
+    """
+    if not workers or workers <= 1:
+        yield None
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield pool
+
+
+def _call_chunk(task):
+    func, columns, kwargs = task
+    return list(func(*columns, **kwargs))
+
+
+def map_chunks(func, columns, pool=None, chunk_size=CHUNK_SIZE, **kwargs):
+    """
+    Вызывает func(*колонки_блока, **kwargs) для блоков по chunk_size строк.
+    func должна возвращать список той же длины, что и блок.
+    Результат — общий список в исходном порядке строк.
+    """
+    columns = [list(column) for column in columns]
+    total = len(columns[0]) if columns else 0
+    if pool is None or total <= chunk_size:
+        return list(func(*columns, **kwargs))
+
+    tasks = [
+        (func, [column[start:start + chunk_size] for column in columns], kwargs)
+        for start in range(0, total, chunk_size)
+    ]
+    return [value for part in pool.map(_call_chunk, tasks) for value in part]
+
+
+# ======================================
+# Конвейер по файлам: чтение → расчёт → запись
+# ======================================
+# Поток чтения заранее читает следующие книги, поток записи сохраняет
+# предыдущий результат, пока текущий файл считается в основном потоке.
+# Разбор и сериализация .xlsx (openpyxl) — чистый Python и держат GIL, поэтому
+# сами чтение и запись потоки поручают двум отдельным процессам (по одному
+# на этап) и только ждут результат — основной поток считает без помех.
+# Очереди между этапами ограничены depth элементами: в основном процессе
+# одновременно не больше (2 * depth + 3) таблиц, а общее время стремится
+# к времени самого медленного этапа вместо суммы всех трёх.
+
+PIPELINE_DEPTH = 2
+
+# Конец очереди
+_DONE = None
+
+
+def run_pipeline(read, process, write, files, depth=PIPELINE_DEPTH, initializer=None, initargs=()):
+    """
+    read(filename) — в процессе чтения, process(filename, data) — в текущем потоке,
+    write(filename, result) — в процессе записи; write возвращает путь готового файла.
+    read и write должны быть функциями уровня модуля (передаются в процессы);
+    initializer(*initargs) вызывается один раз в каждом из двух процессов.
+    Ошибка любого этапа не прерывает остальные файлы.
+    Возвращает (список готовых файлов, список (файл, ошибка)) — как run_in_pool.
+    """
+    import queue
+    import threading
+
+    total_files = len(files)
+    read_queue = queue.Queue(maxsize=depth)
+    write_queue = queue.Queue(maxsize=depth)
+    done = []
+    errors = []
+    bar = progress(total=total_files, desc="Файлы")
+
+    with ProcessPoolExecutor(max_workers=1, initializer=initializer, initargs=initargs) as read_pool, \
+            ProcessPoolExecutor(max_workers=1, initializer=initializer, initargs=initargs) as write_pool:
+
+        def reader():
+            for filename in files:
+                try:
+                    read_queue.put((filename, read_pool.submit(read, filename).result(), None))
+                except Exception as e:
+                    read_queue.put((filename, None, e))
+            read_queue.put(_DONE)
+
+        def writer():
+            for i, (filename, result, error) in enumerate(iter(write_queue.get, _DONE), start=1):
+                if error is None:
+                    try:
+                        output_file = write_pool.submit(write, filename, result).result()
+                    except Exception as e:
+                        error = e
+                percent = (i / total_files) * 100
+                if error is None:
+                    done.append(output_file)
+                    say(f"✅ [{i}/{total_files}] ({percent:.1f}%) Обработано: {filename} → {os.path.basename(output_file)}")
+                else:
+                    errors.append((filename, str(error)))
+                    say(f"❌ [{i}/{total_files}] ({percent:.1f}%) Ошибка при обработке файла {filename}: {error}")
+                bar.update()
+
+        # daemon — чтобы прерывание основного потока (Ctrl+C) не оставляло процесс висеть
+        threads = [threading.Thread(target=reader, daemon=True), threading.Thread(target=writer, daemon=True)]
+        for thread in threads:
+            thread.start()
+
+        for filename, data, error in iter(read_queue.get, _DONE):
+            result = None
+            if error is None:
+                try:
+                    result = process(filename, data)
+                except Exception as e:
+                    error = e
+            write_queue.put((filename, result, error))
+        write_queue.put(_DONE)
+
+        for thread in threads:
+            thread.join()
+    bar.close()
+    print_summary(total_files, errors)
+    return done, errors
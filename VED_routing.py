@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+
+from VED_input_cache import file_hash, write_json
+
+# ======================================
+# Маршрутизация по кодам ТН ВЭД (префиксное дерево)
+# ======================================
+# Индекс строится один раз по словарю «код → значение» (code_mapping в VED.py,
+# справочник Products.xlsx в скриптах папки). Код строки сопоставляется
+# с самым длинным совпадающим префиксом: точный 10-значный код важнее
+# 7-значного кода группы ("3105100000" → 07_NPK, "3105100123" → Экспорт NPK).
+# Колонка кодов обрабатывается за один проход: каждый уникальный код ищется
+# в дереве один раз, результат раскладывается по строкам.
+#
+# Справочник (Products.xlsx, лист 'ВЭД') собирается в небольшой JSON с парами
+# «код → Вид МУ» и пересобирается, только если файл справочника изменился, —
+# скриптам не нужно разбирать .xlsx (и импортировать pandas) на каждом запуске.
+
+# Ключ значения в узле дерева (символы кода — непустые строки)
+_VALUE = ''
+
+# Значение для ненайденных кодов — как у Series.map (NaN)
+_MISSING = float('nan')
+
+
+def normalize_code(value):
+    """
+    Код как строка цифр: 3105100000.0 → '3105100000'; пусто/NaN → None.
+    """
+    if value is None or value != value:
+        return None
+    if isinstance(value, float) and value == int(value):
+        value = int(value)
+    code = str(value).strip()
+    return code or None
+
+
+class PrefixIndex:
+    def __init__(self, mapping):
+        """mapping — dict или пары (код, значение); при повторе кода действует последнее значение."""
+        self._root = {}
+        self.codes = {}
+        items = mapping.items() if isinstance(mapping, dict) else mapping
+        for code, value in items:
+            code = normalize_code(code)
+            if code is None:
+                continue
+            node = self._root
+            for char in code:
+                node = node.setdefault(char, {})
+            node[_VALUE] = value
+            self.codes[code] = value
+
+    def __len__(self):
+        return len(self.codes)
+
+    def lookup(self, code, default=None):
+        """Значение для самого длинного префикса кода из индекса."""
+        code = normalize_code(code)
+        if code is None:
+            return default
+        node = self._root
+        found = node.get(_VALUE, default)
+        for char in code:
+            node = node.get(char)
+            if node is None:
+                break
+            found = node.get(_VALUE, found)
+        return found
+
+    def route(self, codes, default=_MISSING):
+        """
+        Значения для колонки кодов (pd.Series с тем же индексом). Не найденные коды → default.
+        """
+        import numpy as np
+        import pandas as pd
+
+        labels, uniques = pd.factorize(codes)
+        # Последний элемент — для пустых кодов (метка -1 у factorize)
+        targets = np.empty(len(uniques) + 1, dtype=object)
+        targets[:-1] = [self.lookup(code, default) for code in uniques]
+        targets[-1] = default
+        return pd.Series(targets[labels], index=codes.index, name=codes.name)
+
+    def groups(self, df, column):
+        """
+        {значение: строки df} по колонке кодов — один проход вместо фильтра на каждое значение.
+        Порядок строк внутри групп сохраняется; строки без совпадения не попадают никуда.
+        """
+        targets = self.route(df[column], default=None)
+        return {target: group for target, group in df.groupby(targets, sort=False)}
+
+
+# ==== СПРАВОЧНИК ====
+def _reference_pairs(path, sheet_name, code_prefix, value_col):
+    import pandas as pd
+
+    df = pd.read_excel(path, sheet_name=sheet_name)
+    code_col = next((c for c in df.columns if str(c).startswith(code_prefix)), None)
+    if code_col is None:
+        raise KeyError(f"❌ В справочнике отсутствует колонка с префиксом '{code_prefix}'")
+    pairs = []
+    for code, value in zip(df[code_col].tolist(), df[value_col].tolist()):
+        code = normalize_code(code)
+        if code is not None:
+            pairs.append([code, value if value == value else None])
+    return pairs
+
+
+def load_reference(path, code_prefix, value_col, sheet_name='ВЭД', cache_dir=None):
+    """
+    PrefixIndex по справочнику. Пары «код → значение» хранятся в cache_dir и берутся оттуда,
+    пока размер и mtime (или SHA-1) файла справочника не изменились.
+    """
+    if not cache_dir:
+        return PrefixIndex(_reference_pairs(path, sheet_name, code_prefix, value_col))
+
+    os.makedirs(cache_dir, exist_ok=True)
+    raw = json.dumps([os.path.abspath(path), sheet_name, code_prefix, value_col], ensure_ascii=False)
+    artifact = os.path.join(cache_dir, f"reference_{hashlib.sha1(raw.encode('utf-8')).hexdigest()}.json")
+    stat = os.stat(path)
+
+    try:
+        with open(artifact, encoding='utf-8') as f:
+            compiled = json.load(f)
+    except (OSError, ValueError):
+        compiled = None
+
+    if compiled is not None:
+        same_stat = compiled['size'] == stat.st_size and compiled['mtime_ns'] == stat.st_mtime_ns
+        if same_stat or compiled['sha1'] == file_hash(path):
+            if not same_stat:
+                compiled.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+                write_json(artifact, compiled)
+            return PrefixIndex(compiled['pairs'])
+
+    compiled = {
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha1': file_hash(path),
+        'pairs': _reference_pairs(path, sheet_name, code_prefix, value_col),
+    }
+    write_json(artifact, compiled)
+    return PrefixIndex(compiled['pairs'])
@@ -0,0 +1,143 @@
+import os
+import sqlite3
+
+# ======================================
+# Индекс уже загруженных строк для целевых книг (VED.py)
+# ======================================
+# Для каждой пары (книга, лист) хранится множество ключей строк — по умолчанию
+# номер декларации + номер товара. Перед дозаписью из исходных данных
+# отбрасываются строки, ключи которых уже есть в индексе, так что повторный
+# запуск после обновления выгрузки дописывает только новые строки.
+# Индекс лежит рядом с книгами (output_folder/row_index.sqlite). Лист
+# сканируется заново (read_only), только если книга изменилась не через индекс:
+# первое обращение, ручная правка, удаление и повторное копирование шаблона.
+
+ROW_INDEX_NAME = 'row_index.sqlite'
+KEY_COLUMN_PREFIXES = ("ND", "G32")
+
+# Ограничение SQLite на число параметров в одном запросе
+_CHUNK = 900
+
+# Предупреждение об отсутствии ключевых колонок выводится один раз за запуск
+_warned_no_keys = False
+
+
+def _key_part(value):
+    if value is None or value != value:
+        return None
+    if isinstance(value, float) and value == int(value):
+        value = int(value)
+    return str(value).strip()
+
+
+def _find_key_columns(columns, prefixes=KEY_COLUMN_PREFIXES):
+    found = []
+    for prefix in prefixes:
+        col = next((c for c in columns if isinstance(c, str) and c.startswith(prefix)), None)
+        if col is None:
+            return None
+        found.append(col)
+    return found
+
+
+def row_keys(df, prefixes=KEY_COLUMN_PREFIXES):
+    """
+    Ключи строк DataFrame ('декларация|товар'); None — если ключевых колонок нет или значение пустое.
+    """
+    global _warned_no_keys
+    key_cols = _find_key_columns(df.columns, prefixes)
+    if key_cols is None:
+        if not _warned_no_keys:
+            _warned_no_keys = True
+            print(f"⚠️ Нет колонок {' / '.join(prefixes)}: проверка уже загруженных строк отключена, дописываются все строки")
+        return [None] * len(df)
+    keys = []
+    for values in zip(*(df[col].tolist() for col in key_cols)):
+        parts = [_key_part(v) for v in values]
+        keys.append(None if None in parts else '|'.join(parts))
+    return keys
+
+
+class RowKeyIndex:
+    def __init__(self, folder, prefixes=KEY_COLUMN_PREFIXES):
+        self.prefixes = prefixes
+        self.conn = sqlite3.connect(os.path.join(folder, ROW_INDEX_NAME))
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS row_keys '
+            '(workbook TEXT NOT NULL, sheet TEXT NOT NULL, key TEXT NOT NULL, PRIMARY KEY (workbook, sheet, key))'
+        )
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS sheets '
+            '(workbook TEXT NOT NULL, sheet TEXT NOT NULL, mtime_ns INTEGER, PRIMARY KEY (workbook, sheet))'
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    @staticmethod
+    def _mtime(path):
+        return os.stat(path).st_mtime_ns if os.path.exists(path) else None
+
+    def _ensure_sheet(self, path, sheet):
+        """Если книга изменилась после последней записи через индекс — ключи листа считываются из неё заново."""
+        workbook = os.path.basename(path)
+        mtime = self._mtime(path)
+        known = self.conn.execute(
+            'SELECT mtime_ns FROM sheets WHERE workbook = ? AND sheet = ?', (workbook, sheet)
+        ).fetchone()
+        if known and known[0] == mtime:
+            return
+
+        keys = []
+        if os.path.exists(path):
+            from openpyxl import load_workbook
+
+            book = load_workbook(path, read_only=True)
+            try:
+                if sheet in book.sheetnames:
+                    rows = book[sheet].iter_rows(values_only=True)
+                    header = list(next(rows, None) or ())
+                    key_cols = _find_key_columns(header, self.prefixes)
+                    if key_cols is not None:
+                        positions = [header.index(col) for col in key_cols]
+                        for row in rows:
+                            parts = [_key_part(row[p]) if p < len(row) else None for p in positions]
+                            if None not in parts:
+                                keys.append('|'.join(parts))
+            finally:
+                book.close()
+
+        self.conn.execute('DELETE FROM row_keys WHERE workbook = ? AND sheet = ?', (workbook, sheet))
+        self.conn.execute('INSERT OR REPLACE INTO sheets VALUES (?, ?, ?)', (workbook, sheet, mtime))
+        self.conn.executemany('INSERT OR IGNORE INTO row_keys VALUES (?, ?, ?)',
+                              ((workbook, sheet, key) for key in keys))
+        self.conn.commit()
+
+    def new_rows_mask(self, path, sheet, keys):
+        """
+        Маска строк для дозаписи: True — ключа ещё нет в индексе листа.
+        Повторы ключа внутри keys не отбрасываются (как и без индекса); строки без ключа дописываются всегда.
+        """
+        self._ensure_sheet(path, sheet)
+        workbook = os.path.basename(path)
+        unique = [key for key in dict.fromkeys(keys) if key is not None]
+        present = set()
+        for start in range(0, len(unique), _CHUNK):
+            chunk = unique[start:start + _CHUNK]
+            rows = self.conn.execute(
+                f'SELECT key FROM row_keys WHERE workbook = ? AND sheet = ? AND key IN ({",".join("?" * len(chunk))})',
+                [workbook, sheet, *chunk]
+            )
+            present.update(key for (key,) in rows)
+
+        return [key is None or key not in present for key in keys]
+
+    def add(self, path, sheet, keys):
+        """Добавляет ключи записанных строк (вызывать после успешного сохранения книги)."""
+        workbook = os.path.basename(path)
+        self.conn.executemany('INSERT OR IGNORE INTO row_keys VALUES (?, ?, ?)',
+                              ((workbook, sheet, key) for key in keys if key is not None))
+        # Книгу сохранили мы сами — индекс остаётся актуальным для всех её листов
+        self.conn.execute('UPDATE sheets SET mtime_ns = ? WHERE workbook = ?', (self._mtime(path), workbook))
+        self.conn.commit()
@@ -0,0 +1,71 @@
+import csv
+
+import VED_rules
+
+# ======================================
+# Профилирование правил каскада Grade
+# ======================================
+# enable_profiling() включает счётчики, встроенные в сами функции каскада VED_rules
+# (normalize_description, _match_grade, _match_fields и пакетные версии):
+# замеряется тот же код, что работает без профиля. Без вызова enable_profiling
+# счётчики выключены (одна проверка rule_profile is not None на правило).
+#
+# Для каждого правила: сколько раз применялось, сколько раз совпало,
+# сколько раз именно оно дало итоговое значение и суммарное время.
+# В пакетном режиме (determine_grade_batch) счёт идёт по уникальным описаниям.
+# Для движка 'tokens' (VED_tokens) замеряются те же правила в токенном исполнении.
+
+
+class RuleProfile:
+    def __init__(self):
+        # (набор правил, правило) → [применялось, совпало, решило, секунды]
+        self.stats = {}
+
+    def add(self, ruleset, name, ran=0, matched=0, decided=0, seconds=0.0):
+        stat = self.stats.setdefault((ruleset, name), [0, 0, 0, 0.0])
+        stat[0] += ran
+        stat[1] += matched
+        stat[2] += decided
+        stat[3] += seconds
+
+    def rows(self):
+        """Строки отчёта, самые затратные правила — первыми."""
+        return [
+            {'ruleset': ruleset, 'rule': name, 'ran': ran, 'matched': matched, 'decided': decided,
+             'seconds': seconds}
+            for (ruleset, name), (ran, matched, decided, seconds)
+            in sorted(self.stats.items(), key=lambda item: -item[1][3])
+        ]
+
+    def report(self, top=None):
+        rows = self.rows()
+        total = sum(row['seconds'] for row in rows) or 1
+        print(f"\n🔬 Профиль правил ({len(rows)} правил, {total:.2f} с):")
+        print(f"   {'набор':<6} {'правило':<28} {'применялось':>11} {'совпало':>9} {'решило':>9} {'время, с':>9}  доля")
+        for row in rows[:top]:
+            print(f"   {row['ruleset']:<6} {row['rule']:<28} {row['ran']:>11} {row['matched']:>9} "
+                  f"{row['decided']:>9} {row['seconds']:>9.3f}  {row['seconds'] / total:>5.1%}")
+        dead = [f"{row['ruleset']}:{row['rule']}" for row in rows if row['ran'] and not row['matched']]
+        if dead:
+            print(f"   ⚠️ Ни разу не совпали: {', '.join(dead)}")
+
+    def to_csv(self, path):
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=['ruleset', 'rule', 'ran', 'matched', 'decided', 'seconds'])
+            writer.writeheader()
+            writer.writerows(self.rows())
+
+
+# ==== ВКЛЮЧЕНИЕ / ВЫКЛЮЧЕНИЕ ====
+def enable_profiling():
+    """Включает профилирование в текущем процессе; возвращает RuleProfile."""
+    if VED_rules.rule_profile is None:
+        VED_rules.rule_profile = RuleProfile()
+    return VED_rules.rule_profile
+
+
+def disable_profiling():
+    """Выключает счётчики; результат — накопленный RuleProfile."""
+    profile = VED_rules.rule_profile
+    VED_rules.rule_profile = None
+    return profile
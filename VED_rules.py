@@ -0,0 +1,623 @@
+import hashlib
+import re
+import sys
+import time
+
+# ======================================
+# Правила извлечения N-P-K из описания товара (G31_1)
+# ======================================
+# Все правила описаны декларативно и компилируются один раз при импорте модуля.
+# Во время обработки строк никакие паттерны не строятся — используются
+# только готовые объекты re.Pattern.
+# numpy/pandas импортируются внутри пакетных функций: импорт правил (например,
+# ради RULES_VERSION при проверке манифеста) не тянет тяжёлые библиотеки.
+#
+# Наборы правил:
+#   'full'  — полный каскад VED_folder_BPY.py (ГОСТ/ТУ/кг, x-x-x, NPK, ключи, K2O/P2O5, доп. паттерны)
+#   'basic' — упрощённый каскад VED_multi.py и VED_source.py
+
+# Число: целое или десятичное (через точку или запятую)
+NUMBER = r'(\d+(?:[,.]\d+)?)'
+
+# Что может идти после числа в поиске по ключевым словам: единица, упаковка, разделитель
+KEYWORD_STOPS = (
+    '%', 'мас', 'в пересчёте', 'марка', 'гост', 'п/п', 'кг', 'л', 'литров', 'литра', 'мешк', 'пакет', 'упаковк',
+    'порошок', 'гранулы', 'таблетк', 'вес', 'брутто', 'нетто', 'пластик', 'бумажн', 'поддон', 'паллет', 'предназначен',
+    'используется', 'входит', 'содержит', 'состав', 'марка', 'не более', 'не менее', 'не превышает', 'минимум',
+    'максимум', ',', '.', ';', ':',
+)
+
+# Хвост для поиска по ключевым словам: число, за которым идёт единица/разделитель (или конец строки)
+KEYWORD_TAIL = (
+    r'\D*?(\d+(?:[,.]\d+)?)(?=\s*(?:' + '|'.join(stop.replace('.', r'\.') for stop in KEYWORD_STOPS) + r'|$))'
+)
+
+# Ключевые слова для элементов (порядок важен — срабатывает первое найденное)
+KEYWORDS = {
+    'N': [
+        r'\bазот', r'\bnитрат', r'\bn\s*содержащие', r'\bсодержание\s*азота',
+        r'\bаммонийный\s*азот', r'\bнитрат', r'\bn\s*общий', r'\bаммиачный\s*азот'
+    ],
+    'P': [
+        r'\bфосфор', r'\bp2o5', r'\bп2о5', r'\bphosphorus',
+        r'\bсодержание\s*фосфора', r'\bфосфаты'
+    ],
+    'K': [
+        r'\bкали[йяие]', r'\bk2o', r'\bкалийные', r'\bсодержание\s*калия'
+    ],
+    'Ca': [
+        r'\bкальций', r'\bcao', r'\bca\s*содержащие', r'\bизвесть',
+        r'\bкарбонат\s*кальца', r'\bсодержание\s*кальция', r'\bcacо3'
+    ]
+}
+
+# Пересчёт P2O5 → P
+P2O5_FACTOR = 0.436
+
+
+def _keyword_rules():
+    """Правила поиска по ключевым словам: по одному на элемент."""
+    return [
+        {'name': f'keyword_{el}', 'element': el,
+         'patterns': [(keyword + KEYWORD_TAIL, 1) for keyword in keywords],
+         'only_empty': False, 'limit': 100, 'over_limit': 'zero', 'normalize': True}
+        for el, keywords in KEYWORDS.items()
+    ]
+
+
+# ==== Полный набор (VED_folder_BPY.py) ====
+#
+# strip  — фрагменты, удаляемые из описания до поиска (ГОСТ, ТУ, вес в кг):
+#   (имя, паттерн, флаги, подстрока без которой паттерн не может сработать)
+# grades — явные марки N-P-K; первая сработавшая сразу возвращает результат
+# fields — каскад правил для отдельных элементов, выполняется по порядку:
+#   patterns   — список (паттерн, множитель); берётся первое подходящее значение
+#   only_empty — правило срабатывает, только если элемент ещё не найден
+#   limit      — максимально допустимое значение (None — без ограничения)
+#   over_limit — 'zero': записать 0 и остановиться; 'skip': перейти к следующему паттерну
+#   normalize  — приводить 18.0 → 18
+FULL_RULES = {
+    'strip': [
+        # Простейшие: ГОСТ 2-2013, ГОСТ 2081-2010
+        ('gost_basic', r'гост\s*\d{1,5}-\d{2,4}', re.IGNORECASE, 'гост'),
+        # ГОСТ X–XXXX (равно как и X-XXXX): короткий номер и год
+        ('gost_short', r'гост\s*\d{1,2}[-–]\d{3,4}', re.IGNORECASE, 'гост'),
+        # ГОСТ X–XXXX–XX (доп. суффикс), например ГОСТ 123-456-78
+        ('gost_suffix', r'гост\s*\d{1,5}[-–]\d{2,4}[-–]\d{2,4}', re.IGNORECASE, 'гост'),
+        # ГОСТ X–XXXX: Часть X
+        ('gost_part', r'гост\s*\d{1,5}[-–]\d{2,4}\s*:\s*часть\s*\d+', re.IGNORECASE, 'гост'),
+        # ГОСТ X–XXXX (XXXX)
+        ('gost_year', r'гост\s*\d{1,5}[-–]\d{2,4}\s*\(\d{2,4}\)', re.IGNORECASE, 'гост'),
+        # ГОСТ без пробела перед номером (ГОСТ2-2013)
+        ('gost_nospace', r'гост\d{1,5}[-–]\d{2,4}', re.IGNORECASE, 'гост'),
+        # ТУ 2181-073-05761695-2016
+        ('tu_long', r'ту\s*\d{4}-\d{3}-\d{8}-\d{4}', re.IGNORECASE, 'ту'),
+        # вариант с точками + длинный код
+        ('tu_dotted_long', r'ту\s*\d{2}\.\d{2}\.\d{2}-\d{3}-\d{8}-\d{4}', re.IGNORECASE, 'ту'),
+        ('tu_dotted', r'ту\s*\d{2}\.\d{2}\.\d{2}-\d{3}-\d{4}', 0, 'ту'),
+        ('tu_dotted_year', r'ту\s*\d{2}\.\d{2}\.\d{2}-\d{4}-\d{4}', 0, 'ту'),
+        # Количества в килограммах (10 КГ, 10кг, 10Kg, 10.5кг и т.п.)
+        ('kg', r'(?<!\S)\d+(?:[.,]\d+)?\s*[кk][гg](?!\S)', re.IGNORECASE, None),
+    ],
+    'grades': [
+        # Приоритет: формат x-x-x
+        {'name': 'dash_grade',
+         'pattern': r'\b(\d+(?:[.,]\d+)?)\s*-\s*(\d+(?:[.,]\d+)?)\s*-\s*(\d+(?:[.,]\d+)?)\b',
+         'flags': 0, 'limit': None},
+        # NPK x:x:x, NPK x-x-x или NP(...) x:x
+        {'name': 'npk_grade',
+         'pattern': r'\b(?:npk|np)\s*(?:\([^)]+\))?\s*(\d+(?:\.\d+)?)\s*[:-]\s*(\d+(?:\.\d+)?)'
+                    r'(?:\s*[:-]\s*(\d+(?:\.\d+)?))?',
+         'flags': re.IGNORECASE, 'limit': 100},
+    ],
+    'fields': _keyword_rules() + [
+        {'name': 'k2o_conversion', 'element': 'K',
+         'patterns': [(r'в\sпересч[ёе]те.?k2o\D*' + NUMBER, 1)],
+         'only_empty': False, 'limit': None, 'over_limit': 'skip', 'normalize': True},
+        # "КАЛИЯ В ПЕРЕСЧЕТЕ НА K2O - 50%" или "K2O - 50%"
+        {'name': 'k2o_simple', 'element': 'K',
+         'patterns': [(r'(?:калия\sв\sпересч[ёе]те\sна\s)?k2o\D*' + NUMBER, 1)],
+         'only_empty': True, 'limit': None, 'over_limit': 'skip', 'normalize': True},
+        {'name': 'p2o5_conversion', 'element': 'P',
+         'patterns': [(r'в\sпересч[ёе]те.?p2o5\D*' + NUMBER, P2O5_FACTOR)],
+         'only_empty': False, 'limit': None, 'over_limit': 'skip', 'normalize': True},
+        # "P2O5 - 46%"
+        {'name': 'p2o5_simple', 'element': 'P',
+         'patterns': [(r'p2o5\D*' + NUMBER, P2O5_FACTOR)],
+         'only_empty': True, 'limit': None, 'over_limit': 'skip', 'normalize': True},
+        # Фосфорный ангидрид
+        {'name': 'p_anhydride', 'element': 'P',
+         'patterns': [(r'фосфорн\w*\sангидрид\D*' + NUMBER, 1)],
+         'only_empty': True, 'limit': None, 'over_limit': 'skip', 'normalize': False},
+        # "МАССОВАЯ ДОЛЯ АЗОТА - 18%"
+        {'name': 'n_mass', 'element': 'N',
+         'patterns': [(r'азот\w*\D*' + NUMBER, 1)],
+         'only_empty': True, 'limit': None, 'over_limit': 'skip', 'normalize': False},
+        # "СОДЕРЖАЩИЙ 46,2 МАС.% АЗОТА"
+        {'name': 'n_contains', 'element': 'N',
+         'patterns': [(r'содерж\w*\D*' + NUMBER + r'\s*мас\.?%[^а-я]*азот', 1)],
+         'only_empty': True, 'limit': None, 'over_limit': 'skip', 'normalize': False},
+        # Дополнительные паттерны для азота (N)
+        {'name': 'extra_n', 'element': 'N',
+         'patterns': [
+             (r'азот\w*[^0-9]{0,10}(\d+(?:[.,]\d+)?)\s*%?', 1),
+             (r'содерж\w*[^0-9]{0,10}(\d+(?:[.,]\d+)?)\s*мас\.?%[^а-я]*азот', 1),
+             (r'азот\w*\D*' + NUMBER, 1),
+             (r'содерж\w*\D*' + NUMBER + r'\s*мас\.?%[^а-я]*азот', 1),
+         ],
+         'only_empty': True, 'limit': 100, 'over_limit': 'skip', 'normalize': True},
+        # Дополнительные паттерны для P2O5 (P)
+        {'name': 'extra_p', 'element': 'P',
+         'patterns': [
+             (r'p2o5\D*(\d+(?:[.,]\d+)?)', P2O5_FACTOR),
+             (r'фосфорн\w*\sангидрид\D*' + NUMBER, 1),
+             (r'в\sпересч[ёе]те.?p2o5\D*' + NUMBER, P2O5_FACTOR),
+         ],
+         'only_empty': True, 'limit': 100, 'over_limit': 'skip', 'normalize': True},
+        # Дополнительные паттерны для K2O (K)
+        {'name': 'extra_k', 'element': 'K',
+         'patterns': [
+             (r'калия\sв\sпересч[ёе]те\sна\sk2o\D*' + NUMBER, 1),
+             (r'k2o\D*' + NUMBER, 1),
+             (r'в\sпересч[ёе]те.?k2o\D*' + NUMBER, 1),
+             (r'(?:калия\sв\sпересч[ёе]те\sна\s)?k2o\D*' + NUMBER, 1),
+         ],
+         'only_empty': True, 'limit': 100, 'over_limit': 'skip', 'normalize': True},
+    ],
+}
+
+# ==== Упрощённый набор (VED_multi.py, VED_source.py) ====
+BASIC_RULES = {
+    'strip': [],
+    'grades': [
+        # Явный формат: 12:32:16, 16-16-16 или NPK 16:16:16
+        {'name': 'npk_grade',
+         'pattern': r'\b(?:npk\s*)?(\d+(?:\.\d+)?)\s*[:-]\s*(\d+(?:\.\d+)?)\s*[:-]\s*(\d+(?:\.\d+)?)',
+         'flags': re.IGNORECASE, 'limit': 100},
+    ],
+    'fields': _keyword_rules() + [
+        # "в пересчёте на K2O"
+        {'name': 'k2o_conversion', 'element': 'K',
+         'patterns': [(r'в\s*пересч[ёе]те.*?k2o\D*' + NUMBER, 1)],
+         'only_empty': False, 'limit': None, 'over_limit': 'skip', 'normalize': True},
+        # "в пересчёте на P2O5"
+        {'name': 'p2o5_conversion', 'element': 'P',
+         'patterns': [(r'в\s*пересч[ёе]те.*?p2o5\D*' + NUMBER, P2O5_FACTOR)],
+         'only_empty': False, 'limit': None, 'over_limit': 'skip', 'normalize': True},
+        # "содержание азота"
+        {'name': 'total_n', 'element': 'N',
+         'patterns': [(r'(?:содержание|содержит|общий|содержание азота).*?' + NUMBER, 1)],
+         'only_empty': False, 'limit': None, 'over_limit': 'skip', 'normalize': True},
+    ],
+}
+
+# Все поиски по описанию выполняются без учёта регистра
+SEARCH_FLAGS = re.IGNORECASE
+SPACES = re.compile(r'[\s\xa0\u3000]+')
+WATER_SOLUBLE = re.compile(r'водорастворим\w*')
+# Любое правило Grade ищет числа: описание без цифр всегда даёт X-X-X
+DIGIT = re.compile(r'\d')
+
+
+def compile_rules(spec):
+    """
+    Компилирует декларативный набор правил в готовые к использованию паттерны.
+    """
+    return {
+        'strip': [
+            (name, re.compile(pattern, flags), trigger) for name, pattern, flags, trigger in spec['strip']
+        ],
+        'grades': [
+            (rule['name'], re.compile(rule['pattern'], rule['flags']), rule['limit'])
+            for rule in spec['grades']
+        ],
+        'fields': [
+            (rule['name'], rule['element'],
+             [(re.compile(pattern, SEARCH_FLAGS), factor) for pattern, factor in rule['patterns']],
+             rule['only_empty'], rule['limit'], rule['over_limit'], rule['normalize'])
+            for rule in spec['fields']
+        ],
+    }
+
+
+RULE_SPECS = {
+    'full': FULL_RULES,
+    'basic': BASIC_RULES,
+}
+RULESETS = {name: compile_rules(spec) for name, spec in RULE_SPECS.items()}
+
+# Версия движка: увеличивать при изменении кода каскада или determine_grade.
+# Вместе с содержимым правил даёт версию набора — кэши сбрасываются автоматически.
+ENGINE_VERSION = 1
+RULES_VERSION = {
+    name: hashlib.sha1(f'{ENGINE_VERSION}:{spec!r}'.encode('utf-8')).hexdigest()[:12]
+    for name, spec in RULE_SPECS.items()
+}
+
+
+# Статистика срабатывания правил (VED_rule_profile.enable_profiling); None — профилирование выключено.
+# Построчные функции каскада проверяют флаг один раз на правило, пакетные — на правило и блок строк.
+rule_profile = None
+
+# Итоговых значений нет — ни одно правило не сработало (строка профиля _match_fields)
+NO_MATCH = '(нет совпадений)'
+
+# Движок извлечения N/P/K: 'regex' — каскад регулярных выражений по тексту описания,
+# 'tokens' — однопроходный разбор описания на токены (VED_tokens). Результат один и тот же.
+EXTRACT_ENGINE = 'regex'
+EXTRACT_ENGINES = ('regex', 'tokens')
+
+
+# ==== ФУНКЦИИ ====
+def _to_number(value):
+    return int(value) if value == int(value) else value
+
+
+def _ruleset_name(rules):
+    # Имя набора для профиля: каскада (RULESETS) или токенного движка (VED_tokens.TOKEN_RULESETS, если загружен)
+    tokens = sys.modules.get('VED_tokens')
+    rulesets = list(RULESETS.items()) + (list(tokens.TOKEN_RULESETS.items()) if tokens else [])
+    return next(name for name, compiled in rulesets if compiled is rules)
+
+
+def normalize_description(description, ruleset='full'):
+    """
+    Приводит описание к нижнему регистру, схлопывает пробелы и удаляет ГОСТ/ТУ/кг.
+    """
+    profile = rule_profile
+    desc = SPACES.sub(' ', str(description).lower().strip())
+    for name, pattern, trigger in RULESETS[ruleset]['strip']:
+        if profile is not None:
+            start = time.perf_counter()
+        if trigger is None or trigger in desc:
+            desc, count = pattern.subn('', desc)
+            if profile is not None:
+                profile.add(ruleset, name, ran=1, matched=int(count > 0), seconds=time.perf_counter() - start)
+        elif profile is not None:
+            profile.add(ruleset, name, seconds=time.perf_counter() - start)
+    return desc
+
+
+def _match_grade(rules, desc):
+    profile = rule_profile
+    ruleset = _ruleset_name(rules) if profile is not None else None
+    for name, pattern, limit in rules['grades']:
+        if profile is not None:
+            start = time.perf_counter()
+        match = pattern.search(desc)
+        if profile is not None:
+            profile.add(ruleset, name, ran=1, matched=int(bool(match)), seconds=time.perf_counter() - start)
+        if not match:
+            continue
+        try:
+            values = []
+            for group in match.groups():
+                value = float(group.replace(',', '.')) if group is not None else 0
+                if limit is not None and value > limit:
+                    value = 0
+                values.append(_to_number(value))
+        except ValueError:
+            continue
+        if profile is not None:
+            profile.add(ruleset, name, decided=1)
+        n, p, k = values
+        return {'N': {'value': n}, 'P': {'value': p}, 'K': {'value': k}}
+    return None
+
+
+def _match_fields(rules, desc):
+    profile = rule_profile
+    ruleset = _ruleset_name(rules) if profile is not None else None
+    values = {el: 0 for el in KEYWORDS}
+    # Для профиля: элемент → правило, давшее значение (у правила с несколькими шаблонами — name[i])
+    deciders = {}
+    for name, element, patterns, only_empty, limit, over_limit, normalize in rules['fields']:
+        if only_empty and values[element]:
+            continue
+        for i, (pattern, factor) in enumerate(patterns):
+            if profile is not None:
+                rule = name if len(patterns) == 1 else f'{name}[{i}]'
+                start = time.perf_counter()
+            match = pattern.search(desc)
+            if profile is not None:
+                profile.add(ruleset, rule, ran=1, matched=int(bool(match)), seconds=time.perf_counter() - start)
+            if not match:
+                continue
+            try:
+                value = float(match.group(1).replace(',', '.'))
+            except ValueError:
+                continue
+            if limit is not None and value > limit:
+                if over_limit == 'skip':
+                    continue
+                value = 0
+            value = value * factor if factor != 1 else value
+            values[element] = _to_number(value) if normalize else value
+            if profile is not None:
+                deciders[element] = rule
+            break
+
+    if profile is not None:
+        decided = [rule for element, rule in deciders.items() if values[element]]
+        for rule in decided:
+            profile.add(ruleset, rule, decided=1)
+        if not decided:
+            profile.add(ruleset, NO_MATCH, decided=1)
+    return {el: {'value': value} for el, value in values.items()}
+
+
+def _engine(engine):
+    """(подготовка описания, наборы правил) для движка engine (None — EXTRACT_ENGINE)."""
+    engine = engine or EXTRACT_ENGINE
+    if engine == 'tokens':
+        import VED_tokens
+        return VED_tokens.tokenize, VED_tokens.TOKEN_RULESETS
+    if engine != 'regex':
+        raise ValueError(f"❌ Неизвестный движок извлечения: {engine} (доступны: {', '.join(EXTRACT_ENGINES)})")
+    return normalize_description, RULESETS
+
+
+def extract_npk(description, ruleset='full', engine=None):
+    prepare, rulesets = _engine(engine)
+    rules = rulesets[ruleset]
+    desc = prepare(description, ruleset)
+    return _match_grade(rules, desc) or _match_fields(rules, desc)
+
+
+def format_grade(n, p, k, product):
+    """Собирает строку Grade из значений N, P, K с учётом типа Product"""
+    n = n if isinstance(n, (int, float)) and 0 < n <= 100 else 0
+    p = p if isinstance(p, (int, float)) and 0 < p <= 100 else 0
+    k = k if isinstance(k, (int, float)) and 0 < k <= 100 else 0
+
+    if product == 'Калий':
+        n = 0; p = 0
+    elif product == 'NP':
+        k = 0
+    elif product == 'PK':
+        n = 0
+    elif product == 'NS':
+        p = 0; k = 0
+    elif product == 'Ca':
+        n = 0; p = 0; k = 0
+
+    n = int(n) if isinstance(n, float) and n == int(n) else n
+    p = int(p) if isinstance(p, float) and p == int(p) else p
+    k = int(k) if isinstance(k, float) and k == int(k) else k
+
+    grade = f"{n}-{p}-{k}"
+    return "X-X-X" if grade == "0-0-0" else grade
+
+
+def determine_grade(description, product, ruleset='full', engine=None):
+    """Возвращает строку вида X-X-X на основе описания и типа Product"""
+    result = extract_npk(description, ruleset, engine)
+    return format_grade(result['N']['value'], result['P']['value'], result['K']['value'], product)
+
+
+# ==== ПАКЕТНАЯ ОБРАБОТКА ====
+def normalize_batch(descriptions, ruleset='full'):
+    """
+    normalize_description для целой колонки: строковые операции pandas вместо цикла по строкам.
+    """
+    import pandas as pd
+
+    desc = pd.Series([str(d) for d in descriptions], dtype=object)
+    desc = desc.str.lower().str.strip().str.replace(SPACES, ' ', regex=True)
+    for name, pattern, trigger in RULESETS[ruleset]['strip']:
+        if rule_profile is not None:
+            start, before = time.perf_counter(), desc.copy()
+        if trigger is None:
+            desc = desc.str.replace(pattern, '', regex=True)
+        else:
+            mask = desc.str.contains(trigger, regex=False)
+            if mask.any():
+                desc[mask] = desc[mask].str.replace(pattern, '', regex=True)
+        if rule_profile is not None:
+            rule_profile.add(ruleset, name, ran=len(desc) if trigger is None else int(mask.sum()),
+                             matched=int((desc != before).sum()), seconds=time.perf_counter() - start)
+    return desc
+
+
+def extract_npk_batch(descriptions, ruleset='full', engine=None):
+    """
+    Пакетный extract_npk: явные марки (x-x-x, NPK x:x:x) ищутся по всей колонке
+    уникальных описаний через Series.str.extract, каскад по ключевым словам —
+    только для оставшихся строк. Движок 'tokens' разбирает каждое уникальное описание один раз.
+    Возвращает DataFrame с колонками N, P, K (float) в порядке входных строк.
+    """
+    import numpy as np
+    import pandas as pd
+
+    rules = RULESETS[ruleset]
+    # Одинаковые описания обрабатываются один раз
+    codes, uniques = pd.factorize(pd.Series([str(d) for d in descriptions], dtype=object))
+    index = descriptions.index if isinstance(descriptions, pd.Series) else None
+
+    if (engine or EXTRACT_ENGINE) != 'regex':
+        values = np.zeros((len(uniques), 3))
+        for pos, desc in enumerate(uniques):
+            result = extract_npk(desc, ruleset, engine)
+            values[pos] = (result['N']['value'], result['P']['value'], result['K']['value'])
+        return pd.DataFrame(values[codes], columns=['N', 'P', 'K'], index=index)
+
+    pending = normalize_batch(uniques, ruleset)
+    values = np.zeros((len(pending), 3))
+
+    for name, pattern, limit in rules['grades']:
+        if pending.empty:
+            break
+        start = time.perf_counter()
+        found = pending.str.extract(pattern)
+        matched = found[0].notna().to_numpy()
+        if rule_profile is not None:
+            hits = int(matched.sum())
+            rule_profile.add(ruleset, name, ran=len(pending), matched=hits, decided=hits,
+                             seconds=time.perf_counter() - start)
+        # Необязательная группа (K в "NP 12:52") даёт 0
+        nums = found[matched].apply(lambda col: col.str.replace(',', '.').astype(float)).fillna(0).to_numpy(dtype=float, copy=True)
+        if limit is not None:
+            nums[nums > limit] = 0
+        values[pending.index[matched]] = nums
+        pending = pending[~matched]
+
+    for pos, desc in pending.items():
+        result = _match_fields(rules, desc)
+        values[pos] = (result['N']['value'], result['P']['value'], result['K']['value'])
+
+    return pd.DataFrame(values[codes], columns=['N', 'P', 'K'], index=index)
+
+
+def npk_batch(descriptions, ruleset='full', engine=None):
+    """extract_npk_batch в виде списка троек [N, P, K] — для map_chunks и кэша Grade."""
+    return extract_npk_batch(descriptions, ruleset, engine).to_numpy().tolist()
+
+
+# ==== ВЕКТОРНЫЙ РАСЧЁТ GRADE ====
+# Элементы, которые не учитываются для Product (как в format_grade)
+PRODUCT_ZEROING = {
+    'Калий': 'NP',
+    'NP': 'K',
+    'PK': 'N',
+    'NS': 'PK',
+    'Ca': 'NPK',
+}
+# Product, для которых проверяется водорастворимость (ВРУ)
+WATER_SOLUBLE_PRODUCTS = ['НПК', 'Прочие NP/NPK']
+
+
+def npk_array(values, products):
+    """
+    Значения N, P, K (массив строк × 3 или список троек) для Grade: вне (0, 100] — 0,
+    элементы из PRODUCT_ZEROING обнуляются по маске Product.
+    """
+    import numpy as np
+    import pandas as pd
+
+    values = np.array(values, dtype=float).reshape(-1, 3)
+    # NaN тоже даёт 0
+    values[~((values > 0) & (values <= 100))] = 0
+    # Маска сохраняемых элементов по Product; последняя строка (индекс -1) — Product вне PRODUCT_ZEROING
+    keep = np.array([[el not in elements for el in 'NPK'] for elements in PRODUCT_ZEROING.values()] + [[True] * 3])
+    rows = pd.Index(list(PRODUCT_ZEROING)).get_indexer(pd.Series(products, dtype=object))
+    return values * keep[rows]
+
+
+def format_grades(values):
+    """Строки Grade для массива строк × 3 (после npk_array): каждая уникальная тройка форматируется один раз."""
+    import numpy as np
+    import pandas as pd
+
+    # Код тройки — из кодов значений по колонкам (pd.factorize быстрее np.unique(axis=0))
+    codes = np.zeros(len(values), dtype=np.int64)
+    for column in values.T:
+        column_codes, uniques = pd.factorize(column)
+        codes = codes * len(uniques) + column_codes
+    codes, uniques = pd.factorize(codes)
+    first = np.empty(len(uniques), dtype=np.int64)
+    first[codes[::-1]] = np.arange(len(values))[::-1]
+    strings = np.array([format_grade(n, p, k, None) for n, p, k in values[first].tolist()], dtype=object)
+    return strings[codes]
+
+
+def below_one_mask(values, grades):
+    """
+    check_all_less_than_one по массиву: все значения < 1, но не все 0 (X-X-X).
+    Запись с экспонентой ('1e-05-0-0') check_all_less_than_one не разбирает — такой Grade остаётся.
+    """
+    import numpy as np
+
+    mask = (values < 1).all(axis=1) & (values > 0).any(axis=1)
+    if mask.any():
+        mask[mask] = np.array(['e' not in grade for grade in grades[mask]], dtype=bool)
+    return mask
+
+
+def grade_batch(values, products, below_one=False):
+    """
+    Grade по значениям N, P, K и Product — векторно; строка собирается один раз в конце.
+    below_one=True — ещё и правило check_all_less_than_one ('' если все элементы < 1).
+    Возвращает массив строк (object).
+    """
+    values = npk_array(values, products)
+    grades = format_grades(values)
+    if below_one:
+        grades[below_one_mask(values, grades)] = ''
+    return grades
+
+
+def determine_grade_batch(descriptions, products, ruleset='full', engine=None):
+    """Пакетный determine_grade: список Grade в порядке входных строк"""
+    values = extract_npk_batch(descriptions, ruleset, engine)
+    return grade_batch(values.to_numpy(), products).tolist()
+
+
+def check_all_less_than_one(grade):
+    if not grade or grade == 'X-X-X':
+        return grade
+    parts = grade.split('-')
+    try:
+        nums = [float(x) for x in parts]
+        if all(x < 1 for x in nums):
+            return ''
+    except ValueError:
+        pass
+    return grade
+
+
+def product_type(description, product):
+    if product in ['НПК', 'Прочие NP/NPK']:
+        import pandas as pd
+        if pd.notna(description) and WATER_SOLUBLE.search(str(description).lower()):
+            return 'ВРУ'
+    return ''
+
+
+def check_product_type(row, desc_col):
+    return product_type(row[desc_col], row['Product'])
+
+
+def pregrade_batch(descriptions, products):
+    """
+    Предварительная разметка строк (векторно, без каскада правил):
+    ''      — Product не из allowed_product_types (Grade всё равно очищается);
+    'X-X-X' — в описании нет ни одной цифры (NaN, пустое, только текст).
+    Возвращает (массив Grade с None для остальных строк, маска строк, которые нужно считать).
+    """
+    import numpy as np
+    import pandas as pd
+
+    allowed = pd.Series(products, dtype=object).isin(allowed_product_types).to_numpy()
+    # str() — как в extract_npk: NaN → 'nan', числа → их запись
+    has_digits = pd.Series(descriptions, dtype=object).astype(str).str.contains(DIGIT).to_numpy(dtype=bool)
+    grades = np.full(len(allowed), None, dtype=object)
+    grades[~allowed] = ''
+    grades[allowed & ~has_digits] = 'X-X-X'
+    return grades, allowed & has_digits
+
+
+def check_product_type_batch(descriptions, products):
+    """
+    Пакетный check_product_type: маска Product из WATER_SOLUBLE_PRODUCTS и поиск
+    «водорастворим» только в этих строках. Возвращает массив 'ВРУ' / ''.
+    """
+    import numpy as np
+    import pandas as pd
+
+    descriptions = pd.Series(descriptions, dtype=object)
+    result = np.full(len(descriptions), '', dtype=object)
+    mask = pd.Series(products, dtype=object).isin(WATER_SOLUBLE_PRODUCTS).to_numpy() & descriptions.notna().to_numpy()
+    if mask.any():
+        found = descriptions[mask].astype(str).str.lower().str.contains(WATER_SOLUBLE).to_numpy(dtype=bool)
+        result[np.flatnonzero(mask)[found]] = 'ВРУ'
+    return result
+
+
+allowed_product_types = {
+    "НПК", "МАФ", "Карбамид", "Прочие удобрения животного или растительного происхождения",
+    "Прочие фосфорные удобрения", "PK", "CAN", "AN", "Прочие NP/NPK",
+    "НПК в таблетках или упаковке менее 10 кг", "AS", "КАС", "Калий",
+    "SOP", "ДАФ", "NP", "Нитрат натрия", "NS", "CN",
+    "Прочие калийные удобрения", "Удобрения животного или растительного происхождения",
+    "Прочие суперфосфаты", "Суперфосфаты"
+}
@@ -0,0 +1,238 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import time
+
+from VED_bench import build_corpus
+
+# ======================================
+# Синтетические выгрузки и замер масштабирования
+# ======================================
+# generate — папка с Products.xlsx, input/*.xlsx (колонки как в реальной выгрузке,
+#            смесь кодов G33 и доля повторяющихся описаний G31_1) и Target_files
+#            с шаблонами для VED.py;
+# run      — для каждого размера: полный прогон VED_folder_BPY.py (или VED_multi.py)
+#            при разном числе процессов и маршрутизация VED.py в шаблоны.
+#            Отчёт: время, строк/с, пик RSS, ускорение относительно 1 процесса.
+#
+#   python VED_scale.py run --sizes 10000 100000 1000000 --files 4 --workers 1 2 4
+#
+# Каждый прогон — отдельный процесс с холодными кэшами (grade_cache, .input_cache, output).
+# Пик RSS — максимум по процессам дерева (os.wait4), а не сумма по пулу.
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+WORK_DIR = './scale'
+
+# Колонки выгрузки
+ND_COL = 'ND (Номер декларации)'
+G32_COL = 'G32 (Номер товара)'
+TNVED_COL = 'G33 (код товара по ТН ВЭД РФ)'
+DESC_COL = 'G31_1 (Описание и характеристика товара)'
+MASS_COL = 'G38 (Масса нетто)'
+VALUE_COL = 'G42 (Фактурная стоимость)'
+
+# Коды ТН ВЭД и их доля в выгрузке группы 31 (последний — кода нет в справочнике)
+CODES = [
+    ('3105200000', 18), ('3102100000', 12), ('3102300000', 10), ('3104200000', 8), ('3105100000', 6),
+    ('3105300000', 5), ('3105400000', 5), ('3102600000', 3), ('3105510000', 3), ('3105909900', 3),
+    ('3105908000', 2), ('3101000000', 2), ('2834210000', 2), ('3105100900', 2), ('2835240000', 1),
+    ('2833210000', 1), ('3102500000', 1), ('2915120000', 1), ('3199999999', 1),
+]
+
+# Справочник Products.xlsx, лист 'ВЭД'
+PRODUCTS = {
+    '3105200000': 'НПК', '3105100000': 'НПК в таблетках или упаковке менее 10 кг', '3102100000': 'Карбамид',
+    '3102300000': 'AN', '3104200000': 'Калий', '3105300000': 'ДАФ', '3105400000': 'МАФ', '3102600000': 'CN',
+    '3105510000': 'Прочие NP/NPK', '3105909900': 'Прочие NP/NPK', '3105908000': 'NP',
+    '3101000000': 'Удобрения животного или растительного происхождения', '2834210000': 'Калиевая селитра',
+    '2835240000': 'Монокалийфосфат',
+}
+
+TEMPLATE_COLUMNS = [ND_COL, G32_COL, TNVED_COL, DESC_COL, MASS_COL, VALUE_COL, 'Цена за т']
+
+DUP_RATE = 0.6
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+DEFAULT_WORKERS = (1, 2, 4)
+
+
+# ==== ГЕНЕРАТОР ====
+def _declaration_rows(rows, descriptions, r, file_no):
+    codes, weights = zip(*CODES)
+    declaration, item = 0, 0
+    for _ in range(rows):
+        # В декларации от 1 до 8 товаров
+        if item == 0 or r.random() < 0.25:
+            declaration += 1
+            item = 0
+        item += 1
+        mass = round(r.uniform(20, 30_000), 3)
+        yield (
+            f'10{file_no:03d}010/{declaration:07d}', item, int(r.choices(codes, weights)[0]),
+            r.choice(descriptions), mass, round(mass * r.uniform(0.2, 1.5), 2),
+        )
+
+
+def _ved_cell():
+    """Вторая ячейка VED.py (маршрутизация в шаблоны) как код для exec."""
+    with open(os.path.join(REPO_DIR, 'VED.py'), encoding='utf-8') as f:
+        src = f.read()
+    cell = src[src.index('\n-----') + 1:]
+    return cell[cell.index('\n') + 1:]
+
+
+def _ved_namespace():
+    ns = {'__name__': 'VED', '__file__': os.path.join(REPO_DIR, 'VED.py')}
+    exec(compile(_ved_cell(), ns['__file__'], 'exec'), ns)
+    return ns
+
+
+def generate(folder, rows, files=1, dup_rate=DUP_RATE, seed=1):
+    """
+    Создаёт folder/Products.xlsx, folder/input/*.xlsx (files файлов по rows строк)
+    и folder/Target_files с шаблонами VED.py.
+    """
+    import pandas as pd
+    from openpyxl import Workbook
+
+    from VED_xlsx import write_excel_batches
+
+    os.makedirs(os.path.join(folder, 'input'), exist_ok=True)
+    os.makedirs(os.path.join(folder, 'Target_files'), exist_ok=True)
+
+    pd.DataFrame({TNVED_COL: [int(c) for c in PRODUCTS], 'Вид МУ': list(PRODUCTS.values())}).to_excel(
+        os.path.join(folder, 'Products.xlsx'), sheet_name='ВЭД', index=False)
+
+    # Пул уникальных описаний: (1 - dup_rate) от числа строк, остальное — повторы
+    r = random.Random(seed)
+    descriptions = build_corpus(max(1, int(rows * (1 - dup_rate))), seed)
+    columns = [ND_COL, G32_COL, TNVED_COL, DESC_COL, MASS_COL, VALUE_COL]
+    for file_no in range(files):
+        data = list(_declaration_rows(rows, descriptions, r, file_no))
+        frame = pd.DataFrame(data, columns=columns)
+        write_excel_batches(os.path.join(folder, 'input', f'synthetic {file_no:02d}.xlsx'), [frame])
+
+    # Шаблоны для VED.py: листы из sheet_mapping с заголовками выгрузки
+    for filename, sheets in _ved_namespace()['sheet_mapping'].items():
+        book = Workbook()
+        book.remove(book.active)
+        for sheet in sheets:
+            book.create_sheet(sheet).append(TEMPLATE_COLUMNS)
+        book.save(os.path.join(folder, 'Target_files', filename))
+
+
+def run_ved(folder):
+    """Маршрутизация VED.py первого файла из folder/input в folder/Output."""
+    ns = _ved_namespace()
+    ns.update(
+        input_file=os.path.join(folder, 'input', sorted(os.listdir(os.path.join(folder, 'input')))[0]),
+        target_folder=os.path.join(folder, 'Target_files'),
+        output_folder=os.path.join(folder, 'Output'),
+        input_cache_dir=None,
+    )
+    ns['process_data']()
+
+
+# ==== ЗАМЕРЫ ====
+def _measured(cmd, cwd):
+    """Запускает команду; возвращает (секунды, пик RSS в МБ)."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_DIR, os.environ.get('PYTHONPATH')])))
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=cwd, env=env, stdout=subprocess.DEVNULL)
+    _, status, usage = os.wait4(proc.pid, 0)
+    elapsed = time.perf_counter() - start
+    # Процесс уже дождались через wait4 — сообщаем об этом Popen
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode:
+        raise RuntimeError(f"❌ {' '.join(cmd)}: код выхода {proc.returncode}")
+    # ru_maxrss в Linux — в КБ
+    return elapsed, usage.ru_maxrss / 1024
+
+
+def _clean(folder):
+    for name in ('output', 'Output', '.input_cache'):
+        shutil.rmtree(os.path.join(folder, name), ignore_errors=True)
+    if os.path.exists(os.path.join(folder, 'grade_cache.sqlite')):
+        os.remove(os.path.join(folder, 'grade_cache.sqlite'))
+
+
+def run_scaling(sizes=DEFAULT_SIZES, files=1, workers=DEFAULT_WORKERS, script='VED_folder_BPY',
+                work_dir=WORK_DIR, dup_rate=DUP_RATE, seed=1, ved=True):
+    results = []
+    for rows in sizes:
+        folder = os.path.abspath(os.path.join(work_dir, f'{rows}x{files}'))
+        if not os.path.exists(os.path.join(folder, 'Products.xlsx')):
+            print(f"🧪 Генерация: {files} файл(ов) по {rows} строк → {folder}")
+            generate(folder, rows, files, dup_rate, seed)
+
+        base = None
+        for n in workers:
+            _clean(folder)
+            elapsed, rss = _measured([sys.executable, os.path.join(REPO_DIR, f'{script}.py'), '--workers', str(n)], folder)
+            base = base or elapsed
+            result = {'stage': script, 'rows': rows * files, 'files': files, 'workers': n, 'seconds': elapsed,
+                      'rows_per_sec': rows * files / elapsed, 'peak_rss_mb': rss, 'speedup': base / elapsed}
+            results.append(result)
+            _print_result(result)
+
+        if ved:
+            _clean(folder)
+            elapsed, rss = _measured([sys.executable, os.path.abspath(__file__), 'ved', folder], folder)
+            result = {'stage': 'VED.py', 'rows': rows, 'files': 1, 'workers': 1, 'seconds': elapsed,
+                      'rows_per_sec': rows / elapsed, 'peak_rss_mb': rss, 'speedup': 1.0}
+            results.append(result)
+            _print_result(result)
+    return results
+
+
+def _print_result(result):
+    print(f"📊 {result['stage']:<15} {result['rows']:>9} строк  процессов {result['workers']:>2}  "
+          f"{result['seconds']:>8.2f} с  {result['rows_per_sec']:>10,.0f} строк/с  "
+          f"пик RSS {result['peak_rss_mb']:>7.0f} МБ  ускорение ×{result['speedup']:.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Синтетические выгрузки и замер масштабирования")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    gen = sub.add_parser('generate', help="создать синтетические данные")
+    gen.add_argument('folder')
+    gen.add_argument('--rows', type=int, default=DEFAULT_SIZES[0])
+    gen.add_argument('--files', type=int, default=1)
+    gen.add_argument('--dup-rate', type=float, default=DUP_RATE, help="доля повторяющихся описаний")
+    gen.add_argument('--seed', type=int, default=1)
+
+    run = sub.add_parser('run', help="замерить полный прогон при разных размерах и числе процессов")
+    run.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help="строк в одном файле")
+    run.add_argument('--files', type=int, default=1)
+    run.add_argument('--workers', type=int, nargs='+', default=list(DEFAULT_WORKERS))
+    run.add_argument('--script', choices=['VED_folder_BPY', 'VED_multi'], default='VED_folder_BPY')
+    run.add_argument('--work-dir', default=WORK_DIR)
+    run.add_argument('--dup-rate', type=float, default=DUP_RATE)
+    run.add_argument('--seed', type=int, default=1)
+    run.add_argument('--no-ved', action='store_true', help="не замерять VED.py")
+    run.add_argument('--json', help="записать результаты в JSON")
+
+    ved = sub.add_parser('ved', help="прогон VED.py на сгенерированной папке")
+    ved.add_argument('folder')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'generate':
+        generate(args.folder, args.rows, args.files, args.dup_rate, args.seed)
+        print(f"✅ Данные созданы: {args.folder}")
+    elif args.command == 'ved':
+        run_ved(args.folder)
+    else:
+        results = run_scaling(args.sizes, args.files, args.workers, args.script, args.work_dir,
+                              args.dup_rate, args.seed, ved=not args.no_ved)
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+import argparse
+import json
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import VED_folder_BPY
+from VED_rules import EXTRACT_ENGINES
+
+# ======================================
+# Локальный сервис классификации: Product / Grade / Product Type
+# ======================================
+# HTTP-сервис только на 127.0.0.1, без сети и внешних зависимостей (http.server).
+# Логика та же, что у VED_folder_BPY.py: справочник Products.xlsx, набор правил 'full',
+# правило «все элементы < 1» и проверка ВРУ (VED_folder_BPY.grade_frame).
+#
+# Одновременные запросы объединяются в микропакеты: поток расчёта ждёт до --max-wait-ms
+# после первого запроса (или пока не наберётся --max-batch строк) и считает все строки
+# одним векторным проходом, затем раскладывает результаты по запросам.
+#
+#   python VED_service.py --port 8031
+#   curl -s localhost:8031/classify -d '{"rows": [{"code": "3105200000", "description": "NPK 16-16-16"}]}'
+#   curl -s localhost:8031/stats
+#
+# POST /classify — {"rows": [{"code": <G33>, "description": <G31_1>}, ...]}
+#                  → {"rows": [{"code", "Product", "Grade", "Product Type"}, ...]}
+# GET  /stats    — запросы, строки, микропакеты, задержка (p50/p95/p99/max), строк/с
+# GET  /health   — {"status": "ok"}
+
+HOST = '127.0.0.1'
+PORT = 8031
+
+# Микропакет: не больше MAX_BATCH_ROWS строк, ожидание попутных запросов — до MAX_WAIT_MS
+MAX_BATCH_ROWS = 20_000
+MAX_WAIT_MS = 5
+
+# Строк в одном запросе
+MAX_REQUEST_ROWS = 200_000
+
+# Сколько последних запросов учитывается в перцентилях задержки
+LATENCY_WINDOW = 10_000
+
+DESC_COL = "G31_1 (Описание и характеристика товара)"
+RESULT_COLUMNS = ['Product', 'Grade', 'Product Type']
+
+
+def classify(codes, descriptions):
+    """
+    Product / Grade / Product Type для пар (код ТН ВЭД, описание) — как в VED_folder_BPY.grade_frame.
+    Возвращает список словарей в порядке строк.
+    """
+    import pandas as pd
+
+    df = pd.DataFrame({
+        VED_folder_BPY.tnved_col: pd.Series(codes, dtype=object),
+        DESC_COL: pd.Series(descriptions, dtype=object),
+    })
+    df = VED_folder_BPY.grade_frame(df)[RESULT_COLUMNS].astype(object)
+    df = df.where(df.notna(), None)
+    return df.to_dict('records')
+
+
+# ==== МИКРОПАКЕТЫ ====
+class _Job:
+    def __init__(self, codes, descriptions):
+        self.codes = codes
+        self.descriptions = descriptions
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class MicroBatcher:
+    def __init__(self, handle, max_rows=MAX_BATCH_ROWS, max_wait_ms=MAX_WAIT_MS, init=None):
+        """
+        handle(codes, descriptions) вызывается в отдельном потоке для объединённых строк
+        и возвращает список результатов той же длины. init() — один раз в этом потоке
+        (кэш Grade — SQLite-соединение, привязанное к потоку).
+        """
+        self.handle = handle
+        self.max_rows = max_rows
+        self.max_wait = max_wait_ms / 1000
+        self.init = init
+        self.stats = ServiceStats()
+        self._queue = queue.Queue()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._init_error = None
+        self._thread.start()
+        self._ready.wait()
+        if self._init_error is not None:
+            raise self._init_error
+
+    def submit(self, codes, descriptions):
+        """Результаты для строк одного запроса (блокирует до расчёта их микропакета)."""
+        job = _Job(codes, descriptions)
+        self._queue.put(job)
+        job.done.wait()
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def _collect(self):
+        jobs = [self._queue.get()]
+        rows = len(jobs[0].codes)
+        deadline = time.monotonic() + self.max_wait
+        while rows < self.max_rows:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                job = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            jobs.append(job)
+            rows += len(job.codes)
+        return jobs, rows
+
+    def _run(self):
+        try:
+            if self.init is not None:
+                self.init()
+        except Exception as e:
+            self._init_error = e
+            return
+        finally:
+            self._ready.set()
+        while True:
+            jobs, rows = self._collect()
+            start = time.perf_counter()
+            try:
+                results = self.handle([code for job in jobs for code in job.codes],
+                                      [desc for job in jobs for desc in job.descriptions])
+            except Exception as e:
+                for job in jobs:
+                    job.error = e
+            else:
+                offset = 0
+                for job in jobs:
+                    job.result = results[offset:offset + len(job.codes)]
+                    offset += len(job.codes)
+            self.stats.add_batch(len(jobs), rows, time.perf_counter() - start)
+            for job in jobs:
+                job.done.set()
+
+
+# ==== СТАТИСТИКА ====
+class ServiceStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.requests = 0
+        self.errors = 0
+        self.rows = 0
+        self.batches = 0
+        self.batch_rows = 0
+        self.max_batch_requests = 0
+        self.compute_seconds = 0.0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def add_batch(self, requests, rows, seconds):
+        with self._lock:
+            self.batches += 1
+            self.batch_rows += rows
+            self.max_batch_requests = max(self.max_batch_requests, requests)
+            self.compute_seconds += seconds
+
+    def add_request(self, rows, seconds, ok=True):
+        with self._lock:
+            self.requests += 1
+            self.rows += rows
+            self.errors += not ok
+            self.latencies.append(seconds)
+
+    def to_dict(self):
+        with self._lock:
+            latencies = sorted(self.latencies)
+            uptime = time.time() - self.started
+
+            def percentile(share):
+                return latencies[min(len(latencies) - 1, int(share * len(latencies)))] * 1000 if latencies else None
+
+            return {
+                'uptime_sec': uptime,
+                'requests': self.requests,
+                'errors': self.errors,
+                'rows': self.rows,
+                'batches': self.batches,
+                'rows_per_batch': self.batch_rows / self.batches if self.batches else None,
+                'requests_per_batch_max': self.max_batch_requests,
+                'latency_ms': {
+                    'p50': percentile(0.50),
+                    'p95': percentile(0.95),
+                    'p99': percentile(0.99),
+                    'max': latencies[-1] * 1000 if latencies else None,
+                },
+                # Строк в секунду: за время работы сервиса и за время расчёта микропакетов
+                'rows_per_sec': self.rows / uptime if uptime else None,
+                'compute_rows_per_sec': self.batch_rows / self.compute_seconds if self.compute_seconds else None,
+            }
+
+
+# ==== HTTP ====
+def _parse_rows(body):
+    payload = json.loads(body)
+    rows = payload.get('rows') if isinstance(payload, dict) else None
+    if not isinstance(rows, list):
+        raise ValueError("ожидается {\"rows\": [{\"code\": ..., \"description\": ...}, ...]}")
+    if len(rows) > MAX_REQUEST_ROWS:
+        raise ValueError(f"больше {MAX_REQUEST_ROWS} строк в одном запросе")
+    if not all(isinstance(row, dict) for row in rows):
+        raise ValueError("каждая строка — объект {\"code\": ..., \"description\": ...}")
+    return [row.get('code') for row in rows], [row.get('description') for row in rows]
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    batcher = None
+
+    def _send(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/stats':
+            self._send(200, self.batcher.stats.to_dict())
+        elif self.path == '/health':
+            self._send(200, {'status': 'ok'})
+        else:
+            self._send(404, {'error': f"нет пути {self.path}"})
+
+    def do_POST(self):
+        if self.path != '/classify':
+            self._send(404, {'error': f"нет пути {self.path}"})
+            return
+        start = time.perf_counter()
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            codes, descriptions = _parse_rows(self.rfile.read(length))
+        except ValueError as e:
+            self.batcher.stats.add_request(0, time.perf_counter() - start, ok=False)
+            self._send(400, {'error': str(e)})
+            return
+
+        try:
+            results = self.batcher.submit(codes, descriptions) if codes else []
+        except Exception as e:
+            self.batcher.stats.add_request(len(codes), time.perf_counter() - start, ok=False)
+            self._send(500, {'error': str(e)})
+            return
+        self.batcher.stats.add_request(len(codes), time.perf_counter() - start)
+        self._send(200, {'rows': [dict(result, code=code) for code, result in zip(codes, results)]})
+
+    def log_message(self, format, *args):
+        # Без строки в консоли на каждый запрос — сводка в /stats
+        pass
+
+
+class ServiceServer(ThreadingHTTPServer):
+    # Очередь входящих соединений (по умолчанию 5): пачка одновременных запросов не сбрасывается
+    request_queue_size = 256
+    daemon_threads = True
+
+
+def init_service(engine):
+    # Справочник, кэш Grade и прогрев правил — в потоке расчёта микропакетов
+    VED_folder_BPY.grade_engine = engine
+    VED_folder_BPY.init_worker()
+    classify(['3105200000'], ['npk 16-16-16'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Локальный HTTP-сервис: Product / Grade / Product Type по коду и описанию")
+    parser.add_argument('--port', type=int, default=PORT, help=f"порт на {HOST} (по умолчанию {PORT})")
+    parser.add_argument('--max-batch', type=int, default=MAX_BATCH_ROWS,
+                        help=f"строк в микропакете (по умолчанию {MAX_BATCH_ROWS})")
+    parser.add_argument('--max-wait-ms', type=float, default=MAX_WAIT_MS,
+                        help=f"ожидание попутных запросов для микропакета, мс (по умолчанию {MAX_WAIT_MS})")
+    parser.add_argument('--engine', choices=EXTRACT_ENGINES, default=VED_folder_BPY.grade_engine,
+                        help=f"движок извлечения N/P/K (по умолчанию {VED_folder_BPY.grade_engine})")
+    parser.add_argument('--no-cache', action='store_true', help="не использовать постоянный кэш Grade")
+    args = parser.parse_args(argv)
+
+    if args.no_cache:
+        VED_folder_BPY.grade_cache_file = None
+    ServiceHandler.batcher = MicroBatcher(classify, args.max_batch, args.max_wait_ms,
+                                          init=lambda: init_service(args.engine))
+
+    server = ServiceServer((HOST, args.port), ServiceHandler)
+    print(f"🌐 Сервис: http://{HOST}:{args.port} (POST /classify, GET /stats). Ctrl+C — выход")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("🛑 Сервис остановлен")
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,621 @@
+import argparse
+import re
+import sys
+from bisect import bisect_left, bisect_right
+
+import VED_rules
+from VED_rules import RULE_SPECS, RULESETS, KEYWORDS, KEYWORD_STOPS, KEYWORD_TAIL, NUMBER
+
+# ======================================
+# Токенный движок извлечения N/P/K
+# ======================================
+# Каскад регулярных выражений (VED_rules) просматривает описание заново для каждого
+# правила: до 11 замен при нормализации, десятки поисков по ключевым словам.
+# Здесь описание разбирается за один проход (tokenize) на:
+#   - числа (цепочки цифр) с позициями;
+#   - ключевые слова — начала слов из HEADS (азот, p2o5, k2o, кали…, содерж…, пересч…);
+#   - количества в кг (удаляются из текста, как правило 'kg');
+#   - ГОСТ/ТУ (при их наличии текст нормализуется правилами strip по порядку —
+#     последовательные удаления влияют друг на друга).
+# Правила N/P/K затем вычисляются по этим токенам: каждое правило набора
+# повторяет семантику своего регулярного выражения (включая возвраты \w*, \D*?
+# и проверку того, что идёт после числа) и возвращает те же группы.
+# Правило, для которого токенного разбора нет, выполняется своим регулярным
+# выражением по нормализованному тексту — результат совпадает с 'regex'.
+# Единственное известное отличие: экзотические варианты букв, равные обычным только
+# при IGNORECASE (ſ, ᲀ…), токенный движок считает другими буквами.
+#
+# Выбор движка: VED_rules.EXTRACT_ENGINE или параметр engine в determine_grade.
+#
+#   python VED_tokens.py --rows 20000 — сверка движков на корпусе VED_bench (код выхода 1 при расхождении)
+
+# Начала ключевых слов: ни одно не является началом другого,
+# поэтому в каждой позиции текста срабатывает не больше одного
+HEADS = (
+    'phosphorus', 'карбонат', 'известь', 'нитрат', 'содерж', 'пересч', 'общий', 'азот', 'фосф', 'p2o5', 'п2о5',
+    'амм', 'кал', 'k2o', 'ca', 'n',
+)
+
+# Номера ГОСТ и ТУ: каждое правило strip для них начинается так
+GOST_TU = r'(?:гост|ту)\s*\d'
+
+
+# ==== РАЗБОР НА ТОКЕНЫ ====
+def _scanner(strip=()):
+    parts = []
+    if strip:
+        parts.append(f'(?P<span>{GOST_TU})')
+    for name, pattern, _, _ in strip:
+        if name == 'kg':
+            parts.append(f'(?P<kg>{pattern})')
+    parts.append(r'(?P<num>\d+)')
+    # Класс первых букв отсекает большинство позиций до перебора HEADS
+    first = ''.join(sorted({head[0] for head in HEADS}))
+    parts.append(f'(?=[{first}])(?=(?P<head>' + '|'.join(HEADS) + ')).')
+    # Текст уже в нижнем регистре — без IGNORECASE разбор вдвое быстрее
+    return re.compile('|'.join(parts))
+
+
+def _strips_known(strip):
+    # Токенный разбор знает удаление кг и ГОСТ/ТУ; остальные правила strip — только по порядку
+    return all(name == 'kg' or name.startswith(('gost', 'tu')) for name, _, _, _ in strip)
+
+
+PLAIN_SCANNER = _scanner()
+SCANNERS = {
+    name: _scanner(spec['strip']) if _strips_known(spec['strip']) else None
+    for name, spec in RULE_SPECS.items()
+}
+
+
+class Tokens:
+    """
+    Описание, разобранное за один проход: text — нормализованный текст (нижний регистр,
+    одиночные пробелы, без ГОСТ/ТУ/кг), starts/ends — границы цепочек цифр,
+    heads — позиции ключевых слов по началу (HEADS).
+    """
+    __slots__ = ('text', 'starts', 'ends', 'heads')
+
+    def __init__(self, text, starts, ends, heads):
+        self.text = text
+        self.starts = starts
+        self.ends = ends
+        self.heads = heads
+
+    def run_end(self, pos):
+        """Конец цепочки цифр, в которой стоит pos."""
+        return self.ends[bisect_right(self.starts, pos) - 1]
+
+    def first_digit(self, pos):
+        """Первая цифра не левее pos (None — цифр дальше нет)."""
+        i = bisect_left(self.ends, pos + 1)
+        if i == len(self.ends):
+            return None
+        return max(self.starts[i], pos)
+
+    def number_ends(self, pos, seps=',.'):
+        """
+        Возможные концы числа \\d+(?:[,.]\\d+)?, начатого в pos, в порядке перебора regex:
+        с дробной частью (если она есть), затем без неё.
+        """
+        text = self.text
+        end = self.run_end(pos)
+        if end + 1 < len(text) and text[end] in seps and text[end + 1].isdecimal():
+            return self.run_end(end + 1), end
+        return end,
+
+    def number(self, pos, seps=',.'):
+        return self.text[pos:self.number_ends(pos, seps)[0]]
+
+
+def _scan(text, scanner):
+    starts, ends, heads = [], [], {}
+    pieces = []
+    cut = removed = 0
+    for match in scanner.finditer(text):
+        kind = match.lastgroup
+        if kind == 'head':
+            heads.setdefault(match.group('head'), []).append(match.start() - removed)
+        elif kind == 'num':
+            starts.append(match.start() - removed)
+            ends.append(match.end() - removed)
+        elif kind == 'kg':
+            pieces.append(text[cut:match.start()])
+            cut = match.end()
+            removed += cut - match.start()
+        else:
+            return None
+    if pieces:
+        pieces.append(text[cut:])
+        text = ''.join(pieces)
+    return Tokens(text, starts, ends, heads)
+
+
+def tokenize(description, ruleset='full'):
+    """
+    Разбор описания на токены для набора правил ruleset.
+    Текст совпадает с normalize_description: SPACES + strip те же, что в VED_rules.
+    """
+    # ' '.join(split()) — то же, что SPACES.sub(' ', ...strip()): пробельные символы у str.split и \s одни и те же
+    text = ' '.join(str(description).lower().split())
+    scanner = SCANNERS[ruleset]
+    tokens = _scan(text, scanner) if scanner is not None else None
+    if tokens is None:
+        # ГОСТ/ТУ (или неизвестные правила strip): удаление по порядку, как в каскаде
+        tokens = _scan(VED_rules.normalize_description(description, ruleset), PLAIN_SCANNER)
+    return tokens
+
+
+# ==== ПОМОЩНИКИ ====
+class _Match(tuple):
+    """Результат правила в виде, совместимом с re.Match: group(1) и groups()."""
+
+    def group(self, index):
+        return self[index - 1]
+
+    def groups(self):
+        return tuple(self)
+
+
+def _is_word(char):
+    # \w в re: буквы, цифры и подчёркивание
+    return char.isalnum() or char == '_'
+
+
+def _word_start(text, pos):
+    # \b перед словом
+    return pos == 0 or not _is_word(text[pos - 1])
+
+
+def _word_end(text, pos):
+    # конец \w*
+    while pos < len(text) and _is_word(text[pos]):
+        pos += 1
+    return pos
+
+
+def _skip_spaces(text, pos):
+    # \s* — после нормализации пробельные символы только ' '
+    while pos < len(text) and text[pos] == ' ':
+        pos += 1
+    return pos
+
+
+def _head(literal):
+    return next((head for head in HEADS if literal.startswith(head)), None)
+
+
+def _occurrences(tokens, literal, head=None):
+    """Позиции literal в тексте (в любом месте слова) по возрастанию."""
+    positions = tokens.heads.get(head or _head(literal))
+    if not positions:
+        return ()
+    text = tokens.text
+    return [pos for pos in positions if text.startswith(literal, pos)]
+
+
+def _segments_end(text, pos, segments):
+    """Конец 'a\\s*b\\s*c' с начала pos или None."""
+    for i, segment in enumerate(segments):
+        if i:
+            pos = _skip_spaces(text, pos)
+        if not text.startswith(segment, pos):
+            return None
+        pos += len(segment)
+    return pos
+
+
+def _number_after(tokens, ends, seps=',.'):
+    """\\D*(число) после первого из концов ends, за которым вообще есть цифры."""
+    for end in ends:
+        pos = tokens.first_digit(end)
+        if pos is not None:
+            return _Match((tokens.number(pos, seps),))
+    return None
+
+
+def _number_starts(tokens, end, bounded):
+    """
+    Начала числа после '\\w*\\D*' (bounded=False) или '\\w*[^0-9]{0,10}' (bounded=True)
+    от позиции end — в порядке, в котором их перебирает regex (\\w* отдаёт символы с конца).
+    """
+    text = tokens.text
+    last = None
+    for start in range(_word_end(text, end), end - 1, -1):
+        if bounded:
+            skip = 0
+            while skip < 10 and start + skip < len(text) and text[start + skip] not in '0123456789':
+                skip += 1
+            candidates = [start + j for j in range(skip, -1, -1)
+                          if start + j < len(text) and text[start + j].isdecimal()]
+        else:
+            pos = tokens.first_digit(start)
+            candidates = [] if pos is None else [pos]
+        for pos in candidates:
+            if pos != last:
+                last = pos
+                yield pos
+
+
+def _mass_of_nitrogen(text, pos):
+    """'\\s*мас\\.?%[^а-я]*азот' с позиции pos."""
+    pos = _skip_spaces(text, pos)
+    if not text.startswith('мас', pos):
+        return False
+    pos += 3
+    if text.startswith('.', pos):
+        pos += 1
+    if not text.startswith('%', pos):
+        return False
+    pos += 1
+    while pos < len(text) and not 'а' <= text[pos] <= 'я':
+        pos += 1
+    return text.startswith('азот', pos)
+
+
+def _stop_follows(text, pos):
+    """Проверка хвоста KEYWORD_TAIL после числа: '\\s*' и KEYWORD_STOPS или конец строки."""
+    pos = _skip_spaces(text, pos)
+    return pos == len(text) or text.startswith(KEYWORD_STOPS, pos)
+
+
+def _conversion_ends(tokens, oxide, gap):
+    """
+    Концы 'в\\sпересч[ёе]те.?<oxide>' (gap='one') или 'в\\s*пересч[ёе]те.*?<oxide>' (gap='any').
+    """
+    text = tokens.text
+    for pos in tokens.heads.get('пересч') or ():
+        if gap == 'one':
+            if not (pos >= 2 and text[pos - 2:pos] == 'в '):
+                continue
+        else:
+            before = pos
+            while before > 0 and text[before - 1] == ' ':
+                before -= 1
+            if not (before > 0 and text[before - 1] == 'в'):
+                continue
+        end = pos + 6
+        if not (text[end:end + 1] in ('ё', 'е') and text.startswith('те', end + 1)):
+            continue
+        end += 3
+        if gap == 'one':
+            if text.startswith(oxide, end + 1):
+                yield end + 1 + len(oxide)
+            elif text.startswith(oxide, end):
+                yield end + len(oxide)
+        else:
+            found = text.find(oxide, end)
+            if found != -1:
+                yield found + len(oxide)
+
+
+# ==== ПРАВИЛА ПО ТОКЕНАМ ====
+# Каждое правило: функция (tokens) → _Match | None, ключ — исходный паттерн из RULE_SPECS
+
+def _keyword_rule(keyword):
+    """'\\bключ' + KEYWORD_TAIL; ключ — литералы с '\\s*' между ними и классом [..] внутри."""
+    if not keyword.startswith(r'\b'):
+        return None
+    alternatives = [[]]
+    for segment in keyword[2:].split(r'\s*'):
+        found = re.fullmatch(r'([^\[\]\\]*)(?:\[([^\]\\]+)\]([^\[\]\\]*))?', segment)
+        if found is None:
+            return None
+        prefix, chars, suffix = found.groups()
+        options = [prefix + char + suffix for char in chars] if chars else [prefix]
+        alternatives = [alt + [option] for alt in alternatives for option in options]
+    head = _head(alternatives[0][0])
+    if head is None or any(_head(alt[0]) != head for alt in alternatives):
+        return None
+
+    def rule(tokens):
+        positions = tokens.heads.get(head)
+        if not positions:
+            return None
+        text = tokens.text
+        for pos in positions:
+            if not _word_start(text, pos):
+                continue
+            for alt in alternatives:
+                end = _segments_end(text, pos, alt)
+                if end is not None:
+                    break
+            else:
+                continue
+            start = tokens.first_digit(end)
+            if start is None:
+                continue
+            for number_end in tokens.number_ends(start):
+                if _stop_follows(text, number_end):
+                    return _Match((text[start:number_end],))
+        return None
+    return rule
+
+
+def _literal_rule(literal, seps=',.'):
+    """'<literal>\\D*(число)'"""
+    head = _head(literal)
+
+    def rule(tokens):
+        return _number_after(tokens, (pos + len(literal) for pos in _occurrences(tokens, literal, head)), seps)
+    return rule
+
+
+def _conversion_rule(oxide, gap):
+    def rule(tokens):
+        if 'пересч' not in tokens.heads:
+            return None
+        return _number_after(tokens, _conversion_ends(tokens, oxide, gap))
+    return rule
+
+
+def _potassium_conversion(tokens):
+    """'калия\\sв\\sпересч[ёе]те\\sна\\sk2o\\D*(число)'"""
+    text = tokens.text
+
+    def ends():
+        for pos in _occurrences(tokens, 'калия в пересч', 'кал'):
+            if text[pos + 14:pos + 15] in ('ё', 'е') and text.startswith('те на k2o', pos + 15):
+                yield pos + 24
+    return _number_after(tokens, ends())
+
+
+def _anhydride(tokens):
+    """'фосфорн\\w*\\sангидрид\\D*(число)'"""
+    text = tokens.text
+
+    def ends():
+        for pos in _occurrences(tokens, 'фосфорн', 'фосф'):
+            end = _word_end(text, pos + 7)
+            if text.startswith(' ангидрид', end):
+                yield end + 9
+    return _number_after(tokens, ends())
+
+
+def _nitrogen_rule(bounded):
+    """'азот\\w*\\D*(число)' или 'азот\\w*[^0-9]{0,10}(число)\\s*%?'"""
+    def rule(tokens):
+        for pos in _occurrences(tokens, 'азот', 'азот'):
+            for start in _number_starts(tokens, pos + 4, bounded):
+                return _Match((tokens.number(start),))
+        return None
+    return rule
+
+
+def _contains_rule(bounded):
+    """'содерж\\w*\\D*(число)\\s*мас\\.?%[^а-я]*азот' (или с [^0-9]{0,10} вместо \\D*)"""
+    def rule(tokens):
+        text = tokens.text
+        for pos in _occurrences(tokens, 'содерж', 'содерж'):
+            for start in _number_starts(tokens, pos + 6, bounded):
+                for end in tokens.number_ends(start):
+                    if _mass_of_nitrogen(text, end):
+                        return _Match((text[start:end],))
+        return None
+    return rule
+
+
+def _total_nitrogen(tokens):
+    """'(?:содержание|содержит|общий|содержание азота).*?(число)'"""
+    if 'содерж' not in tokens.heads and 'общий' not in tokens.heads:
+        return None
+    text = tokens.text
+    ends = sorted(
+        [pos + len(word) for pos in tokens.heads.get('содерж', ())
+         for word in ('содержание', 'содержит') if text.startswith(word, pos)]
+        + [pos + 5 for pos in tokens.heads.get('общий', ())]
+    )
+    return _number_after(tokens, ends)
+
+
+def _number_at(tokens, pos, seps):
+    """Число \\d+(?:<sep>\\d+)? с позиции pos, если там цифра; (строка, конец) или None."""
+    text = tokens.text
+    if pos >= len(text) or not text[pos].isdecimal():
+        return None
+    end = tokens.number_ends(pos, seps)[0]
+    return text[pos:end], end
+
+
+def _separator(text, pos, chars):
+    """'\\s*[chars]\\s*' с позиции pos: позиция после или None."""
+    pos = _skip_spaces(text, pos)
+    if pos < len(text) and text[pos] in chars:
+        return _skip_spaces(text, pos + 1)
+    return None
+
+
+def _dash_grade(tokens):
+    """'\\b(x)\\s*-\\s*(x)\\s*-\\s*(x)\\b', x = \\d+(?:[.,]\\d+)?"""
+    text = tokens.text
+    for start in tokens.starts:
+        if not _word_start(text, start):
+            continue
+        first = _number_at(tokens, start, ',.')
+        pos = _separator(text, first[1], '-')
+        second = _number_at(tokens, pos, ',.') if pos is not None else None
+        if second is None:
+            continue
+        pos = _separator(text, second[1], '-')
+        if pos is None or pos >= len(text) or not text[pos].isdecimal():
+            continue
+        # \\b после третьего числа: сначала с дробной частью, затем без неё
+        for end in tokens.number_ends(pos):
+            if end == len(text) or not _is_word(text[end]):
+                return _Match((first[0], second[0], text[pos:end]))
+    return None
+
+
+def _npk_grade(tokens):
+    """'\\b(?:npk|np)\\s*(?:\\([^)]+\\))?\\s*(x)\\s*[:-]\\s*(x)(?:\\s*[:-]\\s*(x))?', x = \\d+(?:\\.\\d+)?"""
+    text = tokens.text
+    for start in _occurrences(tokens, 'np', 'n'):
+        if not _word_start(text, start):
+            continue
+        pos = _skip_spaces(text, start + (3 if text.startswith('npk', start) else 2))
+        if text.startswith('(', pos):
+            close = text.find(')', pos + 1)
+            # скобки без содержимого или без закрывающей — правило здесь не срабатывает
+            if close <= pos + 1:
+                continue
+            pos = _skip_spaces(text, close + 1)
+        first = _number_at(tokens, pos, '.')
+        if first is None:
+            continue
+        pos = _separator(text, first[1], ':-')
+        second = _number_at(tokens, pos, '.') if pos is not None else None
+        if second is None:
+            continue
+        pos = _separator(text, second[1], ':-')
+        third = _number_at(tokens, pos, '.') if pos is not None else None
+        return _Match((first[0], second[0], third[0] if third else None))
+    return None
+
+
+def _npk_triple(tokens):
+    """'\\b(?:npk\\s*)?(x)\\s*[:-]\\s*(x)\\s*[:-]\\s*(x)', x = \\d+(?:\\.\\d+)?"""
+    text = tokens.text
+    starts = sorted(
+        [(pos, _skip_spaces(text, pos + 3)) for pos in _occurrences(tokens, 'npk', 'n')]
+        + [(pos, pos) for pos in tokens.starts]
+    )
+    for start, pos in starts:
+        if not _word_start(text, start):
+            continue
+        groups = []
+        for i in range(3):
+            if i:
+                pos = _separator(text, pos, ':-')
+                if pos is None:
+                    break
+            number = _number_at(tokens, pos, '.')
+            if number is None:
+                break
+            groups.append(number[0])
+            pos = number[1]
+        else:
+            return _Match(groups)
+    return None
+
+
+def _token_rules():
+    """Исходный паттерн из RULE_SPECS → правило по токенам."""
+    rules = {}
+    for keywords in KEYWORDS.values():
+        for keyword in keywords:
+            rule = _keyword_rule(keyword)
+            if rule is not None:
+                rules[keyword + KEYWORD_TAIL] = rule
+    rules.update({
+        # Явные марки
+        r'\b(\d+(?:[.,]\d+)?)\s*-\s*(\d+(?:[.,]\d+)?)\s*-\s*(\d+(?:[.,]\d+)?)\b': _dash_grade,
+        r'\b(?:npk|np)\s*(?:\([^)]+\))?\s*(\d+(?:\.\d+)?)\s*[:-]\s*(\d+(?:\.\d+)?)'
+        r'(?:\s*[:-]\s*(\d+(?:\.\d+)?))?': _npk_grade,
+        r'\b(?:npk\s*)?(\d+(?:\.\d+)?)\s*[:-]\s*(\d+(?:\.\d+)?)\s*[:-]\s*(\d+(?:\.\d+)?)': _npk_triple,
+        # Оксиды и пересчёт
+        r'в\sпересч[ёе]те.?k2o\D*' + NUMBER: _conversion_rule('k2o', 'one'),
+        r'в\sпересч[ёе]те.?p2o5\D*' + NUMBER: _conversion_rule('p2o5', 'one'),
+        r'в\s*пересч[ёе]те.*?k2o\D*' + NUMBER: _conversion_rule('k2o', 'any'),
+        r'в\s*пересч[ёе]те.*?p2o5\D*' + NUMBER: _conversion_rule('p2o5', 'any'),
+        r'калия\sв\sпересч[ёе]те\sна\sk2o\D*' + NUMBER: _potassium_conversion,
+        # Необязательный префикс не меняет число: оно берётся после первого k2o
+        r'(?:калия\sв\sпересч[ёе]те\sна\s)?k2o\D*' + NUMBER: _literal_rule('k2o'),
+        r'k2o\D*' + NUMBER: _literal_rule('k2o'),
+        r'p2o5\D*' + NUMBER: _literal_rule('p2o5'),
+        r'p2o5\D*(\d+(?:[.,]\d+)?)': _literal_rule('p2o5'),
+        r'фосфорн\w*\sангидрид\D*' + NUMBER: _anhydride,
+        # Азот
+        r'азот\w*\D*' + NUMBER: _nitrogen_rule(False),
+        r'азот\w*[^0-9]{0,10}(\d+(?:[.,]\d+)?)\s*%?': _nitrogen_rule(True),
+        r'содерж\w*\D*' + NUMBER + r'\s*мас\.?%[^а-я]*азот': _contains_rule(False),
+        r'содерж\w*[^0-9]{0,10}(\d+(?:[.,]\d+)?)\s*мас\.?%[^а-я]*азот': _contains_rule(True),
+        r'(?:содержание|содержит|общий|содержание азота).*?' + NUMBER: _total_nitrogen,
+    })
+    return rules
+
+
+TOKEN_RULES = _token_rules()
+
+
+# ==== НАБОРЫ ПРАВИЛ ДЛЯ КАСКАДА ====
+class _Rule:
+    """Правило для каскада VED_rules (_match_grade / _match_fields): search(tokens) вместо pattern.search(text)."""
+    __slots__ = ('search',)
+
+    def __init__(self, search):
+        self.search = search
+
+
+def _rule(source, compiled):
+    rule = TOKEN_RULES.get(source)
+    if rule is None:
+        # Токенного разбора нет — регулярное выражение по нормализованному тексту
+        return _Rule(lambda tokens: compiled.search(tokens.text))
+    return _Rule(rule)
+
+
+def compile_token_rules(name):
+    """Набор правил name в той же структуре, что VED_rules.RULESETS[name], с правилами по токенам."""
+    spec, compiled = RULE_SPECS[name], RULESETS[name]
+    return {
+        'grades': [
+            (rule_name, _rule(rule['pattern'], pattern), limit)
+            for rule, (rule_name, pattern, limit) in zip(spec['grades'], compiled['grades'])
+        ],
+        'fields': [
+            (rule_name, element,
+             [(_rule(source, pattern), factor) for (source, _), (pattern, factor) in zip(rule['patterns'], patterns)],
+             only_empty, limit, over_limit, normalize)
+            for rule, (rule_name, element, patterns, only_empty, limit, over_limit, normalize)
+            in zip(spec['fields'], compiled['fields'])
+        ],
+    }
+
+
+TOKEN_RULESETS = {name: compile_token_rules(name) for name in RULE_SPECS}
+
+
+# ==== СВЕРКА С КАСКАДОМ ====
+def check_parity(descriptions, products, rulesets=tuple(RULE_SPECS)):
+    """
+    Сравнивает движки 'regex' и 'tokens' на описаниях × Product.
+    Возвращает список расхождений (набор, описание, Product, regex, tokens).
+    """
+    mismatches = []
+    for ruleset in rulesets:
+        for description in descriptions:
+            expected = VED_rules.extract_npk(description, ruleset, engine='regex')
+            actual = VED_rules.extract_npk(description, ruleset, engine='tokens')
+            if repr(expected) != repr(actual):
+                mismatches.append((ruleset, description, None, expected, actual))
+                continue
+            for product in products:
+                expected = VED_rules.determine_grade(description, product, ruleset, engine='regex')
+                actual = VED_rules.determine_grade(description, product, ruleset, engine='tokens')
+                if expected != actual:
+                    mismatches.append((ruleset, description, product, expected, actual))
+    return mismatches
+
+
+def main(argv=None):
+    from VED_bench import DEFAULT_ROWS, PRODUCTS, build_corpus, load_corpus
+
+    parser = argparse.ArgumentParser(description="Сверка токенного движка Grade с каскадом регулярных выражений")
+    parser.add_argument('--rows', type=int, default=DEFAULT_ROWS, help=f"размер корпуса (по умолчанию {DEFAULT_ROWS})")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--corpus', help="xlsx с колонкой G31_1 вместо синтетического корпуса")
+    args = parser.parse_args(argv)
+
+    descriptions = load_corpus(args.corpus, args.rows) if args.corpus else build_corpus(args.rows, args.seed)
+    mismatches = check_parity(descriptions, PRODUCTS)
+    for ruleset, description, product, expected, actual in mismatches[:20]:
+        print(f"   ❌ [{ruleset}] {description!r} ({product}): {expected} ≠ {actual}")
+    if mismatches:
+        print(f"❌ Расхождений: {len(mismatches)} на {len(descriptions)} описаниях")
+        return 1
+    print(f"✅ Движки совпадают: {len(descriptions)} описаний × {len(PRODUCTS)} Product, наборы {', '.join(RULE_SPECS)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+import os
+import time
+
+from VED_metrics import say
+
+# ======================================
+# Наблюдение за папкой с входными файлами
+# ======================================
+# Папка опрашивается раз в interval секунд (os.scandir — без внешних зависимостей).
+# Файл считается готовым, когда его размер и mtime не менялись debounce секунд:
+# выгрузку, которую ещё копируют или сохраняют, в работу не берём.
+# Готовый файл отдаётся обработчику один раз для каждого состояния (размер, mtime):
+# повторно — только если файл снова изменился (в том числе после ошибки обработки).
+# Файлы, которые уже лежали в папке при запуске и давно не менялись, готовы сразу.
+
+WATCH_INTERVAL = 2.0
+WATCH_DEBOUNCE = 5.0
+
+
+def _is_input(name, suffix):
+    # ~$name.xlsx — файл блокировки, который Excel держит рядом с открытой книгой
+    return name.lower().endswith(suffix) and not name.startswith('~$')
+
+
+class FolderWatcher:
+    def __init__(self, folder, suffix='.xlsx', debounce=WATCH_DEBOUNCE):
+        self.folder = folder
+        self.suffix = suffix
+        self.debounce = debounce
+        # имя → (состояние, время, с которого оно не меняется)
+        self._seen = {}
+        # имя → состояние, отданное обработчику
+        self._handled = {}
+        self._scanned = False
+
+    def _scan(self):
+        states = {}
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if entry.is_file() and _is_input(entry.name, self.suffix):
+                    stat = entry.stat()
+                    states[entry.name] = (stat.st_size, stat.st_mtime_ns)
+        return states
+
+    def ready(self, now=None):
+        """Файлы, которые изменились с прошлой обработки и не менялись debounce секунд."""
+        now = time.monotonic() if now is None else now
+        first_scan, self._scanned = not self._scanned, True
+        states = self._scan()
+        for name in set(self._seen) - set(states):
+            del self._seen[name]
+        for name in set(self._handled) - set(states):
+            del self._handled[name]
+
+        ready = []
+        for name, state in sorted(states.items()):
+            previous = self._seen.get(name)
+            if previous is None and first_scan and time.time() - state[1] / 1e9 >= self.debounce:
+                previous = self._seen[name] = (state, now - self.debounce)
+            elif previous is None or previous[0] != state:
+                self._seen[name] = (state, now)
+                continue
+            if self._handled.get(name) != state and now - previous[1] >= self.debounce:
+                ready.append(name)
+        return ready
+
+    def mark_handled(self, names):
+        for name in names:
+            if name in self._seen:
+                self._handled[name] = self._seen[name][0]
+
+    def reset(self):
+        """Все файлы снова будут отданы обработчику (например, после смены справочника)."""
+        self._handled.clear()
+
+
+def watch_folder(folder, handle, interval=WATCH_INTERVAL, debounce=WATCH_DEBOUNCE, suffix='.xlsx', before_poll=None):
+    """
+    Бесконечный цикл: handle(список готовых файлов) для новых и изменённых файлов folder.
+    before_poll(watcher) — вызывается перед каждым опросом (например, проверка справочника).
+    Завершается по Ctrl+C.
+    """
+    watcher = FolderWatcher(folder, suffix, debounce)
+    say(f"👀 Наблюдение за {folder} (опрос раз в {interval:g} с, файл готов через {debounce:g} с без изменений). "
+        f"Ctrl+C — выход")
+    try:
+        while True:
+            if before_poll is not None:
+                before_poll(watcher)
+            names = watcher.ready()
+            if names:
+                handle(names)
+                watcher.mark_handled(names)
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        say("🛑 Наблюдение остановлено")
@@ -0,0 +1,178 @@
+import json
+import os
+
+# ======================================
+# Потоковое чтение .xlsx блоками строк
+# ======================================
+# pd.read_excel загружает лист целиком; здесь книга открывается в режиме
+# read_only и строки читаются через iter_rows, так что в памяти одновременно
+# находится не больше batch_size строк.
+# pandas и openpyxl импортируются внутри функций — модуль дёшево импортировать.
+
+BATCH_SIZE = 50_000
+
+
+def _header(values):
+    """
+    Имена колонок как у pd.read_excel: пустые → 'Unnamed: N', повторы → 'имя.1', 'имя.2'.
+    """
+    columns = []
+    seen = {}
+    for i, value in enumerate(values):
+        name = f'Unnamed: {i}' if value is None else value
+        if name in seen:
+            seen[name] += 1
+            name = f'{name}.{seen[name]}'
+        else:
+            seen[name] = 0
+        columns.append(name)
+    return columns
+
+
+def read_excel_batches(path, batch_size=BATCH_SIZE, sheet_name=None):
+    """
+    Читает лист (по умолчанию первый) и отдаёт DataFrame блоками по batch_size строк.
+    Индекс сквозной — как у pd.read_excel для всего листа. Пустые строки пропускаются.
+    """
+    import pandas as pd
+    from openpyxl import load_workbook
+
+    book = load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = book[sheet_name] if sheet_name is not None else book.worksheets[0]
+        # Размеры листа в файле могут быть записаны неверно — читаем фактические строки
+        ws.reset_dimensions()
+        rows = ws.iter_rows(values_only=True)
+
+        header = next(rows, None)
+        columns = _header(header or ())
+        start = 0
+        batch = []
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            batch.append(row[:len(columns)] + (None,) * (len(columns) - len(row)))
+            if len(batch) >= batch_size:
+                yield pd.DataFrame(batch, columns=columns, index=pd.RangeIndex(start, start + len(batch)))
+                start += len(batch)
+                batch = []
+
+        if batch or start == 0:
+            yield pd.DataFrame(batch, columns=columns, index=pd.RangeIndex(start, start + len(batch)))
+    finally:
+        book.close()
+
+
+# ======================================
+# Заголовки листов без разбора всей книги
+# ======================================
+# pd.read_excel(..., nrows=0) разбирает книгу целиком ради одной строки.
+# read_header открывает книгу в режиме read_only и читает только первую строку;
+# SchemaCache дополнительно запоминает заголовки по пути и mtime файла.
+
+SCHEMA_CACHE_NAME = 'schema_cache.json'
+
+
+def read_header(path, sheet_name=None):
+    """
+    Колонки листа (по умолчанию первого) как у pd.read_excel(path, sheet_name, nrows=0).
+    """
+    from openpyxl import load_workbook
+
+    # data_only — как pandas: вместо формулы её сохранённое значение
+    book = load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = book[sheet_name] if sheet_name is not None else book.worksheets[0]
+        row = next(ws.iter_rows(min_row=1, max_row=1, values_only=True), ())
+    finally:
+        book.close()
+
+    row = list(row)
+    while row and row[-1] is None:
+        row.pop()
+    return _header(row)
+
+
+class SchemaCache:
+    def __init__(self, cache_file):
+        self.cache_file = cache_file
+        self.hits = 0
+        self.misses = 0
+        try:
+            with open(cache_file, encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    @staticmethod
+    def _key(path, sheet_name):
+        return f'{os.path.abspath(path)}|{sheet_name}'
+
+    def columns(self, path, sheet_name):
+        """Заголовок листа из кэша, если файл не менялся; иначе — чтение первой строки."""
+        stat = os.stat(path)
+        entry = self.entries.get(self._key(path, sheet_name))
+        if entry and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+            self.hits += 1
+            return list(entry['columns'])
+
+        self.misses += 1
+        columns = read_header(path, sheet_name)
+        self.entries[self._key(path, sheet_name)] = {
+            'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'columns': columns,
+        }
+        return columns
+
+    def touch(self, path):
+        """
+        Книгу дописали без изменения заголовков — записи для её листов остаются актуальными
+        с новыми mtime и размером.
+        """
+        stat = os.stat(path)
+        prefix = f'{os.path.abspath(path)}|'
+        for key, entry in self.entries.items():
+            if key.startswith(prefix):
+                entry.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+
+    def save(self):
+        tmp = f'{self.cache_file}.{os.getpid()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False, default=str)
+        os.replace(tmp, self.cache_file)
+
+
+# ======================================
+# Потоковая запись .xlsx (write_only)
+# ======================================
+# Книга создаётся в режиме write_only: строки сразу сериализуются во временный
+# файл листа, объектный граф ячеек не строится. Память не растёт с числом строк.
+
+def write_excel_batches(path, batches, sheet_name='Лист 1', digest=None):
+    """
+    Записывает блоки DataFrame в новый лист по порядку: заголовок — колонки первого блока,
+    следующие блоки выравниваются по тем же колонкам. Возвращает число записанных строк.
+    digest (hashlib) — если задан, обновляется содержимым строк (не зависит от деления на блоки).
+    """
+    from openpyxl import Workbook
+
+    book = Workbook(write_only=True)
+    ws = book.create_sheet(sheet_name)
+    columns = None
+    total = 0
+
+    for batch in batches:
+        if columns is None:
+            columns = list(batch.columns)
+            ws.append(columns)
+            if digest is not None:
+                digest.update(repr(columns).encode('utf-8'))
+        values = batch[columns].astype(object).to_numpy()
+        values[batch[columns].isna().to_numpy()] = None
+        for row in values.tolist():
+            ws.append(row)
+            if digest is not None:
+                digest.update(repr(row).encode('utf-8'))
+        total += len(values)
+
+    book.save(path)
+    return total